@@ -5,11 +5,25 @@ Finds ice rink schedule links using Crawl4AI and Claude AI
 """
 
 import os
+import re
 import json
+import time
+import random
 import asyncio
-from datetime import datetime
+import sqlite3
+import hashlib
+import logging
+import logging.handlers
+import queue
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin
 from dotenv import load_dotenv
 import anthropic
+import httpx
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 from crawl4ai.content_filter_strategy import PruningContentFilter
 from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
@@ -17,60 +31,722 @@ from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
 # Load environment variables
 load_dotenv()
 
+CLAUDE_MODEL = "claude-opus-4-5-20251101"
+
+# Where crawl results are cached between runs
+CACHE_DIR = os.getenv('SIRS_CACHE_DIR', '.sirs_cache')
+# Bump when the shape of the cached crawl_data changes; older entries are refetched
+CRAWL_CACHE_VERSION = 2
+
+# First-pass Claude results are reused for unchanged pages for up to a week.
+# Bump PROMPT_VERSION whenever the prompt or the emit_schedules tool changes
+# so stale answers aren't served for the new prompt.
+PROMPT_VERSION = "4"
+CLAUDE_CACHE_TTL = 7 * 24 * 60 * 60
+# Matching ETag/Last-Modified only prove the HTML shell is unchanged, not the
+# schedule a page loads into it, so crawls older than this are redone anyway
+CRAWL_VALIDATOR_MAX_AGE_DAYS = CLAUDE_CACHE_TTL // (24 * 60 * 60)
+
+# Static first-pass instructions, shared verbatim by every site and marked for
+# prompt caching. Keep site and date details out of here. Together with the
+# tool definition they come to well under the 4096-token minimum cacheable
+# prefix of Claude Opus 4.5, so with CLAUDE_MODEL as it is nothing is actually
+# cached; the marker only takes effect on models with a 1024-token minimum
+# (e.g. Sonnet 4.5). The usage logged after each analysis shows which it is.
+SCHEDULE_FINDER_INSTRUCTIONS = """You are analyzing LLM-optimized webpage content from an ice rink website to help users find current ice rink schedule information. The content has been pre-processed by Crawl4AI to remove irrelevant elements. The ice rink name, current date, target months, cleaned page content and extracted links are given in the SITE DETAILS that follow these instructions.
+
+TASK: Find ANY links or references that help users access current ice rink schedule information for the TARGET MONTHS.
+
+SPECIAL ATTENTION FOR CREVE COEUR SCHEDULE PATTERNS:
+- Look for "ImageRepository/Document?documentID=" URLs (common for schedule images)
+- Document IDs like 13239, 13287 may reference current schedules
+- Text like "July 2025 Public" or "August 2025 Public" indicates schedule content
+- PDF documents, calendar pages, schedule viewers
+- Any reference to current month ice times, public skating, hockey schedules
+
+SEARCH PRIORITY:
+1. Direct links to schedule documents (PDFs, ImageRepository URLs, calendar pages)
+2. Pages that mention current month schedules
+3. General ice arena information pages (as fallback)
+
+FOCUS ON GENERAL ICE SCHEDULES ONLY:
+- Public skating schedules and times
+- Hockey schedules (league play, drop-in hockey)
+- Open ice sessions
+- General ice arena operating hours
+- Monthly ice time calendars
+- Freestyle/figure skating session times (when part of general schedule)
+
+DO NOT INCLUDE LESSONS/PROGRAMS:
+- Skating lessons or learn-to-skate programs
+- Hockey camps or clinics
+- Figure skating lessons or camps
+- Youth programs or workshops
+- Registration pages for lessons/programs
+- Class schedules for instructional programs
+
+WHAT TO INCLUDE:
+- Direct URLs to schedule documents (PDFs, images, HTML pages)
+- ImageRepository document links with document IDs
+- Calendar or schedule viewer pages showing ice times
+- Any page where users can VIEW current general ice schedules
+- Month-specific schedule references for general ice use
+- Parent pages that contain or link to general schedules
+
+WHAT TO AVOID:
+- General navigation links
+- Registration-only pages
+- Social media links
+- Obviously unrelated content
+- mailto: email links (these are contact info, not schedules)
+- Contact information or phone numbers
+- Staff directory pages
+- Lesson/program registration systems
+- Instructional program schedules
+
+REQUIREMENTS FOR VALID SCHEDULE LINKS:
+- Must be a clickable URL (http/https) that leads to viewable schedule content
+- Must NOT be email addresses (mailto:) or phone numbers
+- Must actually display or contain schedule information users can view
+
+Focus on being helpful to users who need current ice rink schedules for the TARGET MONTHS.
+
+Extract every relevant schedule URL from the cleaned content and links. Include both direct schedule links AND the parent pages that reference them.
+
+Report your findings by calling the emit_schedules tool. Keep each reasoning to one short sentence."""
+
+# The per-site half of the first-pass prompt, filled from the run's date
+# context plus the site's crawl with str.format_map
+SITE_DETAILS_TEMPLATE = """SITE DETAILS:
+ICE RINK NAME: {site_name}
+CURRENT DATE: {current_date}
+TARGET MONTHS: {current_month} {current_year} and {next_month} {next_year}
+
+WEBPAGE DATA:
+URL: {url}
+Title: {title}
+
+CRAWL4AI CLEANED CONTENT:
+{clean_content}
+
+EXTRACTED LINKS (one per line: url<TAB>link text):
+{links_text}
+
+Extract every relevant schedule URL for {site_name} from the cleaned content and links above."""
+
+# Static second-pass instructions, shared by every location-month group. At
+# ~200 tokens they are far below any model's minimum cacheable prefix, so
+# unlike the first-pass instructions they aren't marked for prompt caching
+SCHEDULE_FILTER_INSTRUCTIONS = """You are analyzing multiple schedule links found for one ice rink location and month, given in the GROUP DETAILS that follow these instructions. Your job is to select the SINGLE BEST link that will help users find current ice skating schedules.
+
+SELECTION CRITERIA (in order of importance):
+1. MUST EXCLUDE: Links where parent_page_link is the same as schedule_link (these are usually navigation pages, not direct schedule documents)
+2. PREFER: Direct links to schedule documents (PDFs, ImageRepository documents, calendar viewers)
+3. PREFER: Links with "high" confidence over "medium" or "low"
+4. PREFER: Links that specifically mention the target month in their reasoning or URL
+5. PREFER: Links to actual schedule documents over general information pages
+6. AVOID: General navigation links, contact pages, or registration systems
+
+TASK: Select the single best schedule link for the location and month in the group details. If all links have parent_page_link = schedule_link, select none.
+
+Report your choice by calling the select_schedule tool with the chosen schedule's index."""
+
+# Structured output for the second pass: Claude picks by index, so it never
+# has to echo a whole schedule object back
+SELECT_SCHEDULE_TOOL = {
+    "name": "select_schedule",
+    "description": "Record which of the group's schedules is the single best link for users.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "selected_index": {"type": "integer", "description": "Index of the best schedule, or -1 if none are valid"},
+            "reasoning": {"type": "string", "maxLength": 200, "description": "One or two sentences on why this is the best choice"},
+            "rejected_count": {"type": "integer", "description": "Number of schedules rejected"}
+        },
+        "required": ["selected_index", "reasoning", "rejected_count"]
+    }
+}
+FILTER_MAX_TOKENS = 300
+
+# Structured output for the first pass: Claude is forced to call this tool,
+# so its input arrives as parsed JSON instead of free text to be salvaged
+SCHEDULES_TOOL = {
+    "name": "emit_schedules",
+    "description": "Record every schedule link on the page that helps users find current ice rink schedules for the target months.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "schedules": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "schedule_link": {"type": "string", "description": "Direct URL to the schedule document or page"},
+                        "parent_page_link": {"type": "string", "description": "URL of the page that contains or references this schedule"},
+                        "ice_rink_name": {"type": "string", "description": "The ICE RINK NAME from the site details"},
+                        "year": {"type": "integer"},
+                        "month": {"type": "string", "description": "Full month name, e.g. July"},
+                        "schedule_type": {"type": "string", "description": "Type of schedule, e.g. public skating"},
+                        "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+                        "reasoning": {"type": "string", "maxLength": 120, "description": "One short sentence on why this link helps users find schedules"}
+                    },
+                    "required": [
+                        "schedule_link", "parent_page_link", "ice_rink_name", "year",
+                        "month", "schedule_type", "confidence", "reasoning"
+                    ]
+                }
+            }
+        },
+        "required": ["schedules"]
+    }
+}
+
+# The tool call is compact JSON with one-sentence reasoning, so a few links'
+# worth of output fits comfortably; output tokens are the expensive ones
+SCHEDULES_MAX_TOKENS = 600
+
+# Token budgets for the per-site part of the first-pass prompt
+SITE_TOKEN_BUDGET = 10000
+CONTENT_TOKEN_BUDGET = 8000
+
+# Local stand-in for Claude's tokenizer: every punctuation mark is a token and
+# every word or number at least one per four characters, so long slugs, query
+# strings and hashes in URLs aren't undercounted. Errs high, which keeps the
+# budgets real upper bounds without a round trip to the token counting API
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def match_tokens(match):
+    """Tokens counted for one TOKEN_PATTERN match: ceil(length / 4)"""
+    return (match.end() - match.start() + 3) // 4
+
+def count_tokens(text):
+    """Estimate (from above) how many tokens Claude will see for text"""
+    return sum(map(match_tokens, TOKEN_PATTERN.finditer(text)))
+
+def trim_to_tokens(text, budget):
+    """Return the longest prefix of text that fits within roughly budget tokens"""
+    count = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        count += match_tokens(match)
+        if count > budget:
+            return text[:match.start()]
+    return text
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+URL_PATTERN = re.compile(r"https?://|\]\(|href=")
+
+def pack_paragraphs(text, budget):
+    """Keep the paragraphs of text most likely to matter within roughly budget tokens
+
+    Pages that already fit are returned unchanged. Otherwise paragraphs (or,
+    for one oversized paragraph, its lines) are ranked by how many links and
+    schedule words they contain and packed greedily, then put back in page
+    order, so a long page keeps its link-dense sections instead of just its
+    first N tokens.
+    """
+    if count_tokens(text) <= budget:
+        return text
+
+    units = []
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        tokens = count_tokens(paragraph)
+        if tokens > budget:
+            units.extend((line, count_tokens(line)) for line in paragraph.split("\n"))
+        elif paragraph.strip():
+            units.append((paragraph, tokens))
+
+    ranked = sorted(
+        range(len(units)),
+        key=lambda i: (
+            len(URL_PATTERN.findall(units[i][0])),
+            len(SCHEDULE_SIGNAL_PATTERN.findall(units[i][0])),
+            -i
+        ),
+        reverse=True
+    )
+
+    kept = set()
+    remaining = budget
+    for i in ranked:
+        unit_tokens = units[i][1]
+        if unit_tokens <= remaining:
+            kept.add(i)
+            remaining -= unit_tokens
+
+    if not kept:
+        # Nothing but single lines longer than the whole budget
+        return trim_to_tokens(text, budget)
+    return "\n\n".join(units[i][0] for i in sorted(kept))
+
+# URLs that look like they lead to a schedule document or calendar
+SCHEDULE_LINK_PATTERN = re.compile(r"\.pdf\b|imagerepository|document|schedul|calendar", re.IGNORECASE)
+
+# Words and URL fragments at least one of which appears on any page that
+# could lead to a schedule; pages with none of them skip Claude entirely
+SCHEDULE_SIGNAL_PATTERN = re.compile(
+    r"schedul|calend|session|public.skat|ice.time|drop.in|open.(?:ice|skat)|\.pdf\b|imagerepository|documentcenter",
+    re.IGNORECASE
+)
+
+def has_schedule_signal(crawl_data):
+    """Whether a crawled page's content or links could possibly point at a schedule"""
+    if SCHEDULE_SIGNAL_PATTERN.search(crawl_data['clean_markdown']):
+        return True
+    return any(SCHEDULE_SIGNAL_PATTERN.search(f"{url} {text}") for url, text in crawl_data['links'])
+
+# Second-pass ranking, mirroring the SCHEDULE_FILTER_INSTRUCTIONS criteria
+CONFIDENCE_RANK = {'high': 2, 'medium': 1, 'low': 0}
+
+# A month's full name or three-letter abbreviation as a word of a URL, so
+# "mar" doesn't match "market" or "jun" "junior"; digits may touch it (feb2026)
+MONTH_URL_PATTERNS = {
+    name: re.compile(rf"(?<![a-z])(?:{name}|{name[:3]})(?![a-z])")
+    for name in ('january', 'february', 'march', 'april', 'may', 'june', 'july',
+                 'august', 'september', 'october', 'november', 'december')
+}
+
+def schedule_score(schedule):
+    """Sort key for picking a location-month's best schedule: higher is better
+
+    In order: the link is not just its parent page, Claude's confidence, the
+    URL looks like a schedule document, the URL names the month, shorter URL.
+    """
+    url = schedule.get('schedule_link', '')
+    month_pattern = MONTH_URL_PATTERNS.get(str(schedule.get('month', '')).lower())
+    return (
+        schedule.get('parent_page_link') != url,
+        CONFIDENCE_RANK.get(str(schedule.get('confidence', '')).lower(), -1),
+        bool(SCHEDULE_LINK_PATTERN.search(url)),
+        bool(month_pattern and month_pattern.search(url.lower())),
+        -len(url)
+    )
+
+# Links that can never be a viewable schedule: contact/script schemes, in-page
+# anchors, and social media profiles (one alternation, so one regex pass per URL)
+JUNK_LINK_PREFIXES = ('mailto:', 'tel:', 'javascript:', 'data:', '#')
+SOCIAL_LINK_PATTERN = re.compile(
+    r"^https?://(?:[^/?#]*\.)?(?:facebook|twitter|x|instagram|linkedin|youtube|tiktok|pinterest|nextdoor)\.com(?:[/:?#]|$)",
+    re.IGNORECASE
+)
+
+def without_fragment(url):
+    """url minus any in-page #anchor; hash routes like #/schedule are kept since they are real pages"""
+    base, _, fragment = url.partition('#')
+    return url if fragment.startswith(('/', '!')) else base
+
+def compact_links(links, budget, page_url='', max_plain_links=30):
+    """Render unique links as "url<TAB>text" lines within roughly budget tokens
+
+    Contact, script, in-page anchor and social media links are dropped and
+    URLs are compared without their #anchor. The rest are ordered by how
+    schedule-like their URL and text look (PDFs, document repositories,
+    calendars), so those survive the budget; links with no schedule words at
+    all are capped at max_plain_links. Returns (count, text). One short line
+    per link costs a fraction of the tokens of Crawl4AI's link dicts.
+    """
+    seen = {without_fragment(page_url)}
+    candidates = []
+    for url, text in links:
+        if url.lower().startswith(JUNK_LINK_PREFIXES) or SOCIAL_LINK_PATTERN.match(url):
+            continue
+        url = without_fragment(url)
+        if url in seen:
+            continue
+        seen.add(url)
+
+        text = ' '.join(text.split())[:60]
+        boost = len(SCHEDULE_LINK_PATTERN.findall(f"{url} {text}"))
+        candidates.append((boost, url, text))
+
+    # Stable sort: equally schedule-like links keep their page order
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    lines = []
+    plain_links = 0
+    for boost, url, text in candidates:
+        if not boost:
+            if plain_links == max_plain_links:
+                break
+            plain_links += 1
+
+        line = f"{url}\t{text}"
+        budget -= count_tokens(line)
+        if budget < 0:
+            break
+        lines.append(line)
+    return len(lines), "\n".join(lines)
+
+# Transient failures worth retrying. retry_async is the only layer retrying
+# these (the client has max_retries=0); rate limits are AdaptiveConcurrencyLimiter's.
+# Status errors are caught broadly and narrowed by is_transient_claude_error
+CLAUDE_RETRY_ERRORS = (anthropic.APIConnectionError, anthropic.APIStatusError, asyncio.TimeoutError)
+# Error types in Claude's error body that mean "try again": an overload
+# mid-stream arrives as a plain APIStatusError with the stream's 200 status
+CLAUDE_TRANSIENT_ERROR_TYPES = {'overloaded_error', 'api_error'}
+
+def is_transient_claude_error(e):
+    """Whether a CLAUDE_RETRY_ERRORS error is worth retrying: connection problems, timeouts, 5xx and overloads (529)"""
+    if not isinstance(e, anthropic.APIStatusError):
+        return True
+    if isinstance(e, anthropic.InternalServerError) or e.status_code == 529:
+        return True
+    error = e.body.get('error') if isinstance(e.body, dict) else None
+    return isinstance(error, dict) and error.get('type') in CLAUDE_TRANSIENT_ERROR_TYPES
+
+# Per-site prompt debugging is opt-in: SIRS_DEBUG=1 (or SIRS_LOG=DEBUG) python admin.py
+DEBUG = os.getenv('SIRS_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+log = logging.getLogger("sirs")
+
+def setup_logging():
+    """Log to stderr from a background thread so concurrent sites never wait on the terminal
+
+    Our level comes from SIRS_LOG (default INFO, or DEBUG when SIRS_DEBUG is
+    set). Returns the started QueueListener; stop it to flush on exit.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    # Libraries (httpx logs every request at INFO) stay at WARNING; SIRS_LOG
+    # only sets how chatty our own messages are
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(message)s",
+        handlers=[logging.handlers.QueueHandler(log_queue)]
+    )
+    level = os.getenv('SIRS_LOG', 'DEBUG' if DEBUG else 'INFO').upper()
+    try:
+        log.setLevel(level)
+    except ValueError:
+        log.setLevel(logging.INFO)
+        log.warning(f"⚠️  Unknown SIRS_LOG level {level!r}, using INFO")
+    listener.start()
+    return listener
+
+# Extra SIRS_DEBUG output for sites whose prompts have needed a closer look:
+# (site name fragment, content window to show, how many links to list,
+#  pattern for links worth calling out)
+PROMPT_DEBUG_SITES = [
+    ("kirkwood", slice(3000, 4000), 0, re.compile(r"mailto|august|coates", re.IGNORECASE)),
+    ("creve coeur", slice(0, 1000), 20, re.compile(r"imagerepository|document|13239|13287", re.IGNORECASE)),
+]
+
+class LinkParser(HTMLParser):
+    """Collect an (href, text) pair for every <a href> on a page, resolved against base_url"""
+
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links = []
+        self.link_href = None
+        self.link_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            if self.link_href:
+                # Unclosed <a>; the new one ends it
+                self.end_link()
+            href = dict(attrs).get('href')
+            if href:
+                self.link_href = urljoin(self.base_url, href.strip())
+                self.link_text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.link_href:
+            self.end_link()
+
+    def handle_data(self, data):
+        if self.link_href is not None:
+            self.link_text.append(data)
+
+    def end_link(self):
+        """Record the open link and return its whitespace-collapsed text"""
+        text = ' '.join(''.join(self.link_text).split())
+        self.links.append((self.link_href, text))
+        self.link_href = None
+        return text
+
+def extract_links(html, base_url):
+    """(href, text) pairs for every link in html"""
+    parser = LinkParser(base_url)
+    parser.feed(html or '')
+    parser.close()
+    return parser.links
+
+class PageTextParser(LinkParser):
+    """Pull markdown-ish text and (href, text) links out of a static HTML page in one pass
+
+    The httpx fast path's stand-in for Crawl4AI's markdown generator: headings
+    become "#" lines, links become [text](url), and script/style noise is skipped.
+    """
+
+    SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'head'}
+    BLOCK_TAGS = {'p', 'div', 'section', 'article', 'li', 'tr', 'br', 'table', 'ul', 'ol', 'header', 'footer', 'nav', 'main'}
+    HEADING_TAGS = {'h1': '# ', 'h2': '## ', 'h3': '### ', 'h4': '#### ', 'h5': '##### ', 'h6': '###### '}
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.title = ''
+        self.lines = []
+        self.current = []
+        self.skip_depth = 0
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            self.in_title = True
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.end_line()
+        elif tag in self.HEADING_TAGS:
+            self.end_line()
+            self.current.append(self.HEADING_TAGS[tag])
+        elif tag == 'a' and not self.skip_depth:
+            super().handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self.in_title = False
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == 'a' and self.link_href:
+            href = self.link_href
+            text = self.end_link()
+            self.current.append(f"[{text}]({href})" if text else href)
+        elif tag in self.BLOCK_TAGS or tag in self.HEADING_TAGS:
+            self.end_line()
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        if self.link_href is not None:
+            self.link_text.append(data)
+        elif not self.skip_depth:
+            self.current.append(data)
+
+    def end_line(self):
+        line = ' '.join(''.join(self.current).split())
+        if line.strip('# '):
+            self.lines.append(line)
+        self.current = []
+
+    def markdown(self):
+        """The page text collected so far, one block per paragraph"""
+        self.end_line()
+        return '\n\n'.join(self.lines)
+
+def first_of_next_month(date):
+    """First day of the month after date, rolling December over into January"""
+    if date.month == 12:
+        return datetime(date.year + 1, 1, 1)
+    return datetime(date.year, date.month + 1, 1)
+
+def schedule_dates(now=None):
+    """Current and next month/year that a run collects schedules for"""
+    now = now or datetime.now()
+    next_month_date = first_of_next_month(now)
+    return {
+        'current_date': now.strftime('%B %d, %Y'),
+        'current_month': now.strftime('%B'),
+        'current_year': now.year,
+        'next_month': next_month_date.strftime('%B'),
+        'next_year': next_month_date.year
+    }
+
+# Links that never change, added for both target months of every run
+STATIC_SCHEDULES = [
+    {
+        "schedule_link": "https://centene.finnlyconnect.com/registration/activityitem/4762",
+        "parent_page_link": "https://www.centenecommunityicecenter.com/ice-skating/public-skating-1",
+        "ice_rink_name": "Centene Community Ice Center",
+        "schedule_type": "Public Skating Registration",
+        "confidence": "high",
+        "reasoning": "Hard-coded static link that never changes - direct registration page for public skating"
+    }
+]
+
+# Only the DOM's text and links are used downstream, so the browser never
+# needs to download what would just be painted
+BLOCKED_RESOURCE_TYPES = {"image", "stylesheet", "font", "media"}
+
+# A page that hasn't loaded in 7 seconds is usually stuck rather than slow, so
+# fail fast and retry; sites.json can give a known-slow site its own "page_timeout"
+CRAWL_PAGE_TIMEOUT = 7000
+CRAWL_TRIES = 3
+
+# Start of the error Crawl4AI reports when a wait_for condition times out
+WAIT_FAILED = "Wait condition failed"
+
+async def block_heavy_resources(page, context=None, **kwargs):
+    """Crawl4AI on_page_context_created hook: abort image, stylesheet, font and media requests"""
+    async def route_request(route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", route_request)
+    return page
+
+def log_token_usage(message):
+    """Log a Claude response's token usage, including what the prompt cache served"""
+    usage = message.usage
+    log.info(f"    Tokens: {usage.input_tokens} input, {usage.cache_read_input_tokens or 0} cache read, "
+             f"{usage.cache_creation_input_tokens or 0} cache write, {usage.output_tokens} output")
+
+class CrawlError(Exception):
+    """Raised when Crawl4AI reports a failed crawl, so it can be retried"""
+
+async def retry_async(call, description, retry_on, tries=4, base_delay=0.5, retry_if=None):
+    """Await call(), retrying retry_on errors (those retry_if accepts, if given) with jittered exponential backoff"""
+    for attempt in range(tries):
+        try:
+            return await call()
+        except retry_on as e:
+            if attempt == tries - 1 or (retry_if and not retry_if(e)):
+                raise
+            delay = base_delay * 2 ** attempt + random.random() * 0.1
+            log.info(f"🔁 {description} failed ({e}); retrying in {delay:.1f}s (attempt {attempt + 2}/{tries})")
+            await asyncio.sleep(delay)
+
+# Longest a single Retry-After header may pause a rate-limited call
+MAX_RETRY_AFTER = 60
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait for a Retry-After header (seconds or an HTTP date), within 0..MAX_RETRY_AFTER"""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            seconds = default
+    if seconds != seconds:  # NaN
+        seconds = default
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit for Claude calls: creep up while calls succeed, back off on rate limits"""
+
+    def __init__(self, initial_concurrency=2, max_concurrency=16, overload_backoff_rate=0.1, max_attempts=6):
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.overload_backoff_rate = overload_backoff_rate
+        self.max_attempts = max_attempts
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    def has_capacity(self):
+        return self.in_flight < max(1, int(self.limit))
+
+    async def run(self, call):
+        """Await call() under the current limit, retrying with a lower limit when Claude rate limits it"""
+        for attempt in range(1, self.max_attempts + 1):
+            async with self.condition:
+                await self.condition.wait_for(self.has_capacity)
+                self.in_flight += 1
+
+            try:
+                result = await call()
+            except anthropic.RateLimitError as e:
+                async with self.condition:
+                    self.in_flight -= 1
+                    self.limit = max(1.0, self.limit * (1 - self.overload_backoff_rate))
+                    self.condition.notify_all()
+
+                if attempt == self.max_attempts:
+                    raise
+                retry_after = parse_retry_after(e.response.headers.get("retry-after"))
+                log.info(f"⏳ Claude rate limited, concurrency limit now {int(self.limit)}; retrying in {retry_after:.0f}s")
+                await asyncio.sleep(retry_after)
+                continue
+            except BaseException:
+                async with self.condition:
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+                raise
+
+            async with self.condition:
+                self.in_flight -= 1
+                # Additive increase: roughly +1 once a full window of calls has succeeded
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.condition.notify_all()
+            return result
+
 class IceScheduleFinder:
     def __init__(self):
-        print("🚀 Initializing SIRS Admin CLI with Crawl4AI...")
+        log.info("🚀 Initializing SIRS Admin CLI with Crawl4AI...")
         self.claude_client = None
+        self.claude_limiter = AdaptiveConcurrencyLimiter()
+        self.http_client = None
+        self.crawl_cache_dir = os.path.join(CACHE_DIR, "crawl")
+        self.date_ctx = schedule_dates()
+        self.claude_cache = None
+        self.force_refresh = False
+        self.crawl_seconds = {}
         self.init_claude()
-        print("✅ SIRS Admin CLI ready")
+        log.info("✅ SIRS Admin CLI ready")
 
     def init_claude(self):
         """Initialize Claude AI client"""
-        print("🤖 Setting up Claude AI...")
+        log.info("🤖 Setting up Claude AI...")
         api_key = os.getenv('ANTHROPIC_API_KEY')
         if not api_key:
             raise ValueError("❌ ANTHROPIC_API_KEY not found in environment variables")
 
-        self.claude_client = anthropic.Anthropic(api_key=api_key)
-        print("✅ Claude AI ready")
+        # Async client so Claude calls don't block the crawler's event loop. The
+        # SDK's own retries are off: they would retry 429s while holding a
+        # limiter slot, so AdaptiveConcurrencyLimiter would see rate limits late
+        self.claude_client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+        log.info("✅ Claude AI ready")
 
     def load_sites_config(self, config_file="sites.json"):
         """Load sites configuration"""
-        print(f"📋 Loading sites configuration from {config_file}...")
+        log.info(f"📋 Loading sites configuration from {config_file}...")
         try:
             with open(config_file, 'r') as f:
                 config = json.load(f)
-            print(f"✅ Loaded {len(config.get('sites', []))} sites")
+            log.info(f"✅ Loaded {len(config.get('sites', []))} sites")
             return config.get('sites', [])
         except FileNotFoundError:
-            print(f"❌ Config file {config_file} not found")
+            log.error(f"❌ Config file {config_file} not found")
             return []
         except json.JSONDecodeError as e:
-            print(f"❌ Error parsing {config_file}: {e}")
+            log.error(f"❌ Error parsing {config_file}: {e}")
             return []
 
-    async def crawl_site_with_crawl4ai(self, site):
-        """Use Crawl4AI to scrape and clean site content for LLM analysis"""
+    async def crawl_site_with_crawl4ai(self, crawler, site):
+        """Use a shared Crawl4AI crawler to scrape and clean site content for LLM analysis"""
         site_name = site.get('name', 'Unknown')
         url = site.get('url', '')
 
-        print(f"\n🔍 Crawling {site_name} with Crawl4AI...")
-        print(f"    URL: {url}")
+        log.info(f"\n🔍 Crawling {site_name} with Crawl4AI...")
+        log.info(f"    URL: {url}")
 
         if not url:
-            print("❌ No URL provided for site")
+            log.error("❌ No URL provided for site")
             return None
 
-        try:
-            # Configure browser for crawling
-            browser_config = BrowserConfig(
-                headless=True,
-                verbose=True
-            )
+        # A cheap HEAD request tells us whether the page changed since the last crawl
+        entry = self.load_cached_crawl(url)
+        validators = await self.probe_page_validators(url)
+        if entry and validators and entry.get('validators') == validators \
+                and (date.today() - date.fromisoformat(entry['fetched_on'])).days < CRAWL_VALIDATOR_MAX_AGE_DAYS:
+            log.info(f"♻️  {site_name} unchanged since last crawl ({', '.join(validators)} match), using cached content")
+            return entry['crawl_data']
 
+        # Wait for real links rather than a fixed delay; slow single-page apps can
+        # name the element that signals their content is ready in sites.json
+        wait_selector = site.get('wait_selector', 'a[href]')
+        wait_for = wait_selector if wait_selector.startswith(('css:', 'js:')) else f"css:{wait_selector}"
+
+        try:
             # Configure crawl settings with smart content filtering
             crawl_config = CrawlerRunConfig(
-                cache_mode=CacheMode.BYPASS,  # Always get fresh content for schedules
+                cache_mode=CacheMode.BYPASS,  # Freshness is decided by our own crawl cache; Crawl4AI's never expires
                 markdown_generator=DefaultMarkdownGenerator(
                     content_filter=PruningContentFilter(
                         threshold=0.20,  # Lower threshold to keep more content
@@ -78,453 +754,765 @@ class IceScheduleFinder:
                         min_word_threshold=0
                     )
                 ),
-                wait_for_timeout=5000,  # Wait 5 seconds for content to load
-                page_timeout=15000,  # Increase page timeout
+                wait_for=wait_for,  # Return as soon as the content we need is in the DOM
+                wait_for_timeout=5000,  # ...but give up on it after 5 seconds
+                page_timeout=site.get('page_timeout', CRAWL_PAGE_TIMEOUT),
                 remove_overlay_elements=True,  # Remove popup overlays
                 screenshot=False,  # Don't need screenshots for schedules
                 js_code=[
-                    "window.scrollTo(0, document.body.scrollHeight);",  # Scroll to load content
-                    "await new Promise(resolve => setTimeout(resolve, 3000));"  # Wait 3 more seconds
+                    "window.scrollTo(0, document.body.scrollHeight);"  # Scroll to load content
                 ],
-                verbose=True
+                verbose=log.isEnabledFor(logging.DEBUG)
             )
 
-            async with AsyncWebCrawler(config=browser_config) as crawler:
+            # Crawl4AI fails the whole crawl when wait_for times out, so the wait
+            # is best-effort: drop it for the rest of this site's attempts and
+            # use whatever the page has rendered by then
+            run_config = crawl_config
+
+            async def fetch():
+                nonlocal run_config
                 result = await crawler.arun(
                     url=url,
-                    config=crawl_config
+                    config=run_config
                 )
+                if not result.success and run_config.wait_for and WAIT_FAILED in (result.error_message or ''):
+                    log.info(f"⏱️  {site_name}: {wait_for} not found in time, crawling without waiting for it")
+                    run_config = crawl_config.clone(wait_for=None)
+                    result = await crawler.arun(
+                        url=url,
+                        config=run_config
+                    )
+                if not result.success:
+                    raise CrawlError(result.error_message)
+                return result
+
+            result = await retry_async(
+                fetch,
+                f"Crawl of {site_name}",
+                (CrawlError, asyncio.TimeoutError),
+                tries=CRAWL_TRIES,
+                base_delay=1.0
+            )
 
-                if result.success:
-                    # Get LLM-optimized content
-                    clean_markdown = result.markdown.fit_markdown  # Pre-filtered for LLMs
-                    raw_html = result.html
-
-                    # Extract all links found by Crawl4AI
-                    all_links = []
-                    if result.links:
-                        internal_links = result.links.get('internal', [])
-                        external_links = result.links.get('external', [])
-                        all_links = internal_links + external_links
-
-                    print(f"✅ Crawl4AI successfully processed {site_name}")
-                    print(f"    Content: {len(clean_markdown)} clean markdown chars")
-                    print(f"    Links: {len(all_links)} total links found")
-
-                    return {
-                        'url': url,
-                        'title': result.metadata.get('title', ''),
-                        'clean_markdown': clean_markdown,
-                        'raw_html': raw_html,
-                        'all_links': all_links,
-                        'metadata': result.metadata
-                    }
-                else:
-                    print(f"❌ Crawl4AI failed for {site_name}: {result.error_message}")
-                    return None
+            # Get LLM-optimized content
+            clean_markdown = result.markdown.fit_markdown  # Pre-filtered for LLMs
+
+            # Just (href, text) pairs straight from the rendered HTML; Crawl4AI's
+            # link dicts carry far more than the prompt ever uses
+            links = extract_links(result.html, result.redirected_url or url)
+
+            log.info(f"✅ Crawl4AI successfully processed {site_name}")
+            log.info(f"    Content: {len(clean_markdown)} clean markdown chars")
+            log.info(f"    Links: {len(links)} total links found")
+
+            # Keep only what the prompt uses; the raw HTML and full metadata
+            # would multiply each site's memory while it waits on Claude
+            crawl_data = {
+                'url': url,
+                'title': (result.metadata or {}).get('title', ''),
+                'clean_markdown': clean_markdown,
+                'links': links
+            }
+            self.store_cached_crawl(url, validators, crawl_data)
+            return crawl_data
 
         except Exception as e:
-            print(f"❌ Error crawling {site_name} with Crawl4AI: {e}")
+            log.error(f"❌ Error crawling {site_name} with Crawl4AI: {e}")
             return None
 
-    def ask_claude_to_find_schedules(self, site_name, crawl_data):
-        """Use Claude to analyze Crawl4AI content and find relevant schedule links"""
-        if not crawl_data:
-            return []
+    async def crawl_site(self, crawler, site):
+        """Fetch a site over plain HTTP when sites.json marks it "needs_js": false, otherwise crawl it with Crawl4AI"""
+        # Schedules change at most daily, so anything fetched today is reused as is
+        entry = self.load_cached_crawl(site.get('url', ''))
+        if entry and entry.get('fetched_on') == date.today().isoformat():
+            log.info(f"\n♻️  {site.get('name', 'Unknown')} already crawled today, using cached content")
+            return entry['crawl_data']
 
-        print(f"🤖 Asking Claude to analyze Crawl4AI content for {site_name}...")
-
-        current_date = datetime.now()
-        current_month = current_date.strftime('%B')
-        current_year = current_date.year
-        next_month_date = datetime(current_year if current_date.month < 12 else current_year + 1,
-                                 current_date.month + 1 if current_date.month < 12 else 1, 1)
-        next_month = next_month_date.strftime('%B')
-        next_year = next_month_date.year
-
-        # Use the clean markdown that Crawl4AI already optimized for LLMs
-        clean_content = crawl_data['clean_markdown'][:15000]  # Generous limit since content is pre-filtered
-
-        # Debug: Show what content we're actually sending to Claude
-        print(f"🔍 DEBUG: Site name: '{site_name}'")
-        print(f"🔍 DEBUG: Content length: {len(clean_content)} chars")
-
-        if "kirkwood" in site_name.lower():
-            print(f"🔍 DEBUG: Kirkwood content sample (chars 3000-4000):")
-            print(f"    {clean_content[3000:4000]}")
-            print(f"🔍 DEBUG: Links containing 'mailto', 'august', or 'coates':")
-            for i, link in enumerate(crawl_data['all_links']):
-                if isinstance(link, dict) and 'url' in link:
-                    url = link['url']
-                elif isinstance(link, str):
-                    url = link
-                else:
-                    continue
+        if site.get('needs_js') is False:
+            crawl_data = await self.fetch_static_site(site)
+            if crawl_data:
+                self.store_cached_crawl(crawl_data['url'], {}, crawl_data)
+                return crawl_data
+            log.warning(f"⚠️  Falling back to Crawl4AI for {site.get('name', 'Unknown')}")
 
-                if url and ('mailto' in url.lower() or 'august' in url.lower() or 'coates' in url.lower()):
-                    print(f"    Found: {url}")
-
-        if "creve coeur" in site_name.lower():
-            print(f"🔍 DEBUG: Creve Coeur content first 1000 chars:")
-            print(f"    {clean_content[:1000]}")
-            print(f"🔍 DEBUG: All links (first 20):")
-            for i, link in enumerate(crawl_data['all_links'][:20]):
-                if isinstance(link, dict) and 'url' in link:
-                    url = link['url']
-                    text = link.get('text', '')
-                elif isinstance(link, str):
-                    url = link
-                    text = ''
-                else:
-                    continue
-                print(f"    {i+1}. {url} (text: '{text}')")
-
-            print(f"🔍 DEBUG: Links containing 'imagerepository', 'document', or ID numbers:")
-            for i, link in enumerate(crawl_data['all_links']):
-                if isinstance(link, dict) and 'url' in link:
-                    url = link['url']
-                elif isinstance(link, str):
-                    url = link
-                else:
-                    continue
+        return await self.crawl_site_with_crawl4ai(crawler, site)
 
-                if url and ('imagerepository' in url.lower() or 'document' in url.lower() or '13239' in url or '13287' in url):
-                    print(f"    Found: {url}")
+    async def fetch_static_site(self, site):
+        """Fetch a static page (or a direct schedule document) with the shared HTTP client, skipping the browser"""
+        site_name = site.get('name', 'Unknown')
+        url = site.get('url', '')
+        if not url:
+            return None
 
-        prompt = f"""You are analyzing LLM-optimized webpage content from {site_name} to help users find current ice rink schedule information. The content has been pre-processed by Crawl4AI to remove irrelevant elements.
+        log.info(f"\n⚡ Fetching {site_name} over HTTP (no browser needed)...")
+        log.info(f"    URL: {url}")
 
-CURRENT DATE: {current_date.strftime('%B %d, %Y')}
-TARGET MONTHS: {current_month} {current_year} and {next_month} {next_year}
+        try:
+            response = await retry_async(
+                lambda: self.http_client.get(url),
+                f"Fetch of {site_name}",
+                (httpx.TransportError,)
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            log.error(f"❌ Error fetching {site_name}: {e}")
+            return None
 
-WEBPAGE DATA:
-URL: {crawl_data['url']}
-Title: {crawl_data['title']}
+        final_url = str(response.url)
+        if 'html' not in response.headers.get('content-type', ''):
+            # The URL is itself a schedule document (e.g. a PDF), so it is the only link
+            crawl_data = {
+                'url': url,
+                'title': site_name,
+                'clean_markdown': '',
+                'links': [(final_url, site_name)]
+            }
+        else:
+            parser = PageTextParser(final_url)
+            parser.feed(response.text)
+            parser.close()
+            crawl_data = {
+                'url': url,
+                'title': ' '.join(parser.title.split()),
+                'clean_markdown': parser.markdown(),
+                'links': parser.links
+            }
 
-CRAWL4AI CLEANED CONTENT:
-{clean_content}
+        log.info(f"✅ Fetched {site_name} without a browser")
+        log.info(f"    Content: {len(crawl_data['clean_markdown'])} clean markdown chars")
+        log.info(f"    Links: {len(crawl_data['links'])} total links found")
+        return crawl_data
 
-EXTRACTED LINKS:
-{json.dumps(crawl_data['all_links'][:50], indent=2)}
+    async def probe_page_validators(self, url):
+        """HEAD a page and return its HTTP cache validators (ETag/Last-Modified), if any"""
+        try:
+            response = await self.http_client.head(url)
+        except httpx.HTTPError as e:
+            log.warning(f"⚠️  HEAD request for {url} failed: {e}")
+            return {}
+
+        if response.status_code != 200:
+            return {}
+        return {
+            header: response.headers[header]
+            for header in ('etag', 'last-modified')
+            if header in response.headers
+        }
 
-TASK: Find ANY links or references that help users access current ice rink schedule information for {current_month} {current_year} and {next_month} {next_year}.
+    def crawl_cache_path(self, url):
+        """Path of the cached crawl for a URL"""
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.crawl_cache_dir, f"{digest}.json")
 
-SPECIAL ATTENTION FOR CREVE COEUR SCHEDULE PATTERNS:
-- Look for "ImageRepository/Document?documentID=" URLs (common for schedule images)
-- Document IDs like 13239, 13287 may reference current schedules
-- Text like "July 2025 Public" or "August 2025 Public" indicates schedule content
-- PDF documents, calendar pages, schedule viewers
-- Any reference to current month ice times, public skating, hockey schedules
+    def load_cached_crawl(self, url):
+        """Return the cache entry (crawl_data, validators, fetched_on) for url, or None"""
+        if not url or self.force_refresh:
+            return None
 
-SEARCH PRIORITY:
-1. Direct links to schedule documents (PDFs, ImageRepository URLs, calendar pages)
-2. Pages that mention current month schedules
-3. General ice arena information pages (as fallback)
+        try:
+            with open(self.crawl_cache_path(url), 'r') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
 
-FOCUS ON GENERAL ICE SCHEDULES ONLY:
-- Public skating schedules and times
-- Hockey schedules (league play, drop-in hockey)
-- Open ice sessions
-- General ice arena operating hours
-- Monthly ice time calendars
-- Freestyle/figure skating session times (when part of general schedule)
+        # Entries written before links were stored as (url, text) pairs are refetched
+        return entry if entry.get('version') == CRAWL_CACHE_VERSION else None
+
+    def store_cached_crawl(self, url, validators, crawl_data):
+        """Cache a crawl along with the validators it was fetched under and the day it was fetched"""
+        os.makedirs(self.crawl_cache_dir, exist_ok=True)
+        path = self.crawl_cache_path(url)
+        entry = {
+            'version': CRAWL_CACHE_VERSION,
+            'validators': validators,
+            'fetched_on': date.today().isoformat(),
+            'crawl_data': crawl_data
+        }
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(f"{path}.tmp", path)
+
+    def claude_result_cache(self):
+        """Open the sqlite cache of first-pass Claude results (once), evicting expired rows"""
+        if self.claude_cache is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self.claude_cache = sqlite3.connect(os.path.join(CACHE_DIR, "claude.sqlite3"))
+            with self.claude_cache:
+                self.claude_cache.execute(
+                    "CREATE TABLE IF NOT EXISTS schedules (key TEXT PRIMARY KEY, schedules TEXT NOT NULL, ts REAL NOT NULL)"
+                )
+                self.claude_cache.execute("DELETE FROM schedules WHERE ts < ?", (time.time() - CLAUDE_CACHE_TTL,))
+        return self.claude_cache
+
+    def schedules_cache_key(self, site_name, crawl_data):
+        """Content-addressed key for everything that shapes a site's first-pass answer"""
+        content = hashlib.blake2b(crawl_data['clean_markdown'].encode('utf-8'))
+        for url, text in crawl_data['links']:
+            content.update(f"\n{url}\t{text}".encode('utf-8'))
+
+        # The target months are part of the prompt, so a new month means a new answer
+        dates = self.date_ctx
+        key = "\n".join([
+            PROMPT_VERSION,
+            CLAUDE_MODEL,
+            site_name,
+            crawl_data['url'],
+            f"{dates['current_month']} {dates['current_year']}",
+            content.hexdigest()
+        ])
+        return hashlib.blake2b(key.encode('utf-8')).hexdigest()
+
+    def load_cached_schedules(self, key):
+        """Schedules Claude found earlier for this cache key, or None"""
+        if self.force_refresh:
+            return None
+        row = self.claude_result_cache().execute("SELECT schedules FROM schedules WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_cached_schedules(self, key, schedules):
+        """Remember Claude's schedules for this cache key"""
+        cache = self.claude_result_cache()
+        with cache:
+            cache.execute(
+                "INSERT OR REPLACE INTO schedules (key, schedules, ts) VALUES (?, ?, ?)",
+                (key, json.dumps(schedules, separators=(',', ':')), time.time())
+            )
 
-DO NOT INCLUDE LESSONS/PROGRAMS:
-- Skating lessons or learn-to-skate programs
-- Hockey camps or clinics
-- Figure skating lessons or camps
-- Youth programs or workshops
-- Registration pages for lessons/programs
-- Class schedules for instructional programs
+    def build_schedule_prompt(self, site_name, crawl_data):
+        """Build the first-pass prompt content blocks asking Claude to find schedule links in a crawled site"""
+        # Use the clean markdown that Crawl4AI already optimized for LLMs, packed
+        # into a token budget and leaving whatever is left over for the links
+        clean_content = pack_paragraphs(crawl_data['clean_markdown'], CONTENT_TOKEN_BUDGET)
+        content_tokens = count_tokens(clean_content)
+        link_count, links_text = compact_links(
+            crawl_data['links'],
+            SITE_TOKEN_BUDGET - content_tokens,
+            page_url=crawl_data['url']
+        )
+
+        # Skip building the dump's strings at all unless debug logging is on
+        if log.isEnabledFor(logging.DEBUG):
+            self.log_prompt_debug(site_name, crawl_data, clean_content, content_tokens, link_count)
+
+        site_details = SITE_DETAILS_TEMPLATE.format_map(dict(
+            self.date_ctx,
+            site_name=site_name,
+            url=crawl_data['url'],
+            title=crawl_data['title'],
+            clean_content=clean_content,
+            links_text=links_text
+        ))
+
+        # The instructions are byte-identical for every site, so they carry the
+        # prompt cache marker and everything site- or date-specific comes after
+        # (see SCHEDULE_FINDER_INSTRUCTIONS for when the marker does anything)
+        return [
+            {
+                "type": "text",
+                "text": SCHEDULE_FINDER_INSTRUCTIONS,
+                "cache_control": {"type": "ephemeral"}
+            },
+            {
+                "type": "text",
+                "text": site_details
+            }
+        ]
 
-WHAT TO INCLUDE:
-- Direct URLs to schedule documents (PDFs, images, HTML pages)
-- ImageRepository document links with document IDs
-- Calendar or schedule viewer pages showing ice times
-- Any page where users can VIEW current general ice schedules
-- Month-specific schedule references for general ice use
-- Parent pages that contain or link to general schedules
+    def log_prompt_debug(self, site_name, crawl_data, clean_content, content_tokens, link_count):
+        """Log what content we're actually sending to Claude (debug logging only)"""
+        log.debug(f"🔍 DEBUG: Site name: '{site_name}'")
+        log.debug(f"🔍 DEBUG: Content length: {len(clean_content)} chars (~{content_tokens} tokens)")
+        log.debug(f"🔍 DEBUG: Links included: {link_count} of {len(crawl_data['links'])}")
 
-WHAT TO AVOID:
-- General navigation links
-- Registration-only pages
-- Social media links
-- Obviously unrelated content
-- mailto: email links (these are contact info, not schedules)
-- Contact information or phone numbers
-- Staff directory pages
-- Lesson/program registration systems
-- Instructional program schedules
+        links = crawl_data['links']
 
-REQUIREMENTS FOR VALID SCHEDULE LINKS:
-- Must be a clickable URL (http/https) that leads to viewable schedule content
-- Must NOT be email addresses (mailto:) or phone numbers
-- Must actually display or contain schedule information users can view
+        for name_fragment, window, listed_links, pattern in PROMPT_DEBUG_SITES:
+            if name_fragment not in site_name.lower():
+                continue
 
-Focus on being helpful to users who need current ice rink schedules for {current_month} and {next_month}.
+            log.debug(f"🔍 DEBUG: {site_name} content sample (chars {window.start}-{window.stop}):")
+            log.debug(f"    {clean_content[window]}")
+
+            if listed_links:
+                log.debug(f"🔍 DEBUG: All links (first {listed_links}):")
+                for i, (url, text) in enumerate(links[:listed_links]):
+                    log.debug(f"    {i+1}. {url} (text: '{text}')")
+
+            log.debug(f"🔍 DEBUG: Links matching {pattern.pattern!r}:")
+            for url in [url for url, _ in links if pattern.search(url)]:
+                log.debug(f"    Found: {url}")
+
+    def schedules_from_message(self, message):
+        """Pull the schedules list out of the emit_schedules tool call in Claude's first-pass response"""
+        if message.stop_reason == "max_tokens":
+            log.warning("⚠️  Claude hit max_tokens, schedule list may be incomplete")
+
+        for block in message.content:
+            if block.type == "tool_use" and block.name == SCHEDULES_TOOL["name"]:
+                schedules = block.input.get('schedules', [])
+                log.info(f"✅ Claude identified {len(schedules)} relevant schedules")
+                for i, schedule in enumerate(schedules, 1):
+                    log.info(f"   {i}. {schedule.get('month', 'Unknown')} {schedule.get('year', 'Unknown')} - {schedule.get('schedule_type', 'Unknown type')} - {schedule.get('confidence', 'unknown')} confidence")
+                    log.info(f"      Schedule Link: {schedule.get('schedule_link', '')}")
+                    log.info(f"      Parent Page: {schedule.get('parent_page_link', '')}")
+                return schedules
+
+        log.error("❌ Claude response missing emit_schedules tool call")
+        return []
+
+    async def ask_claude_to_find_schedules(self, site_name, crawl_data):
+        """Use Claude to analyze Crawl4AI content and find relevant schedule links, streaming the response"""
+        if not crawl_data:
+            return []
 
-Respond with valid JSON only:
+        if not has_schedule_signal(crawl_data):
+            log.info(f"⏭️  Nothing schedule-like on {site_name}, skipping Claude")
+            return []
 
-{{
-  "schedules": [
-    {{
-      "schedule_link": "<direct_url_to_schedule_document_or_page>",
-      "parent_page_link": "<url_of_page_that_contains_or_references_this_schedule>",
-      "ice_rink_name": "{site_name}",
-      "year": <year>,
-      "month": "<month_name>",
-      "schedule_type": "<type_of_schedule>",
-      "confidence": "high|medium|low",
-      "reasoning": "<explanation_of_why_this_helps_users_find_schedules>"
-    }}
-  ]
-}}
+        cache_key = self.schedules_cache_key(site_name, crawl_data)
+        cached = self.load_cached_schedules(cache_key)
+        if cached is not None:
+            log.info(f"♻️  {site_name} unchanged since Claude last analyzed it, reusing {len(cached)} schedules")
+            return cached
 
-Extract every relevant schedule URL from the cleaned content and links. Include both direct schedule links AND the parent pages that reference them."""
+        log.info(f"🤖 Asking Claude to analyze Crawl4AI content for {site_name}...")
+        prompt = self.build_schedule_prompt(site_name, crawl_data)
 
         try:
-            message = self.claude_client.messages.create(
-                model="claude-opus-4-5-20251101",
-                max_tokens=1500,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+            # Stream the response so other sites' crawls and Claude calls keep
+            # making progress while this one is still generating
+            async def stream_response():
+                async with self.claude_client.messages.stream(
+                    model=CLAUDE_MODEL,
+                    max_tokens=SCHEDULES_MAX_TOKENS,
+                    tools=[SCHEDULES_TOOL],
+                    tool_choice={"type": "tool", "name": SCHEDULES_TOOL["name"]},
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ]
+                ) as stream:
+                    return await stream.get_final_message()
+
+            message = await retry_async(
+                lambda: self.claude_limiter.run(stream_response),
+                f"Claude analysis of {site_name}",
+                CLAUDE_RETRY_ERRORS,
+                retry_if=is_transient_claude_error
             )
+            log.info(f"🤖 Claude analysis complete for {site_name}")
+            log_token_usage(message)
 
-            response_text = message.content[0].text.strip()
-            print(f"🤖 Claude analysis complete")
-
-            # Parse Claude's JSON response
-            try:
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-
-                if json_start != -1 and json_end > json_start:
-                    json_text = response_text[json_start:json_end]
-                    claude_analysis = json.loads(json_text)
-
-                    if 'schedules' in claude_analysis:
-                        schedules = claude_analysis['schedules']
-                        print(f"✅ Claude identified {len(schedules)} relevant schedules")
-                        for i, schedule in enumerate(schedules, 1):
-                            print(f"   {i}. {schedule.get('month', 'Unknown')} {schedule.get('year', 'Unknown')} - {schedule.get('schedule_type', 'Unknown type')} - {schedule.get('confidence', 'unknown')} confidence")
-                            print(f"      Schedule Link: {schedule.get('schedule_link', '')}")
-                            print(f"      Parent Page: {schedule.get('parent_page_link', '')}")
-                        return schedules
-                    else:
-                        print("❌ Claude response missing 'schedules' field")
-                        return []
-                else:
-                    print("❌ No valid JSON found in Claude response")
-                    return []
-
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON parsing error: {e}")
-                print(f"📄 Raw Claude response: {response_text}")
-                return []
+            schedules = self.schedules_from_message(message)
+            if message.stop_reason == "tool_use":
+                self.store_cached_schedules(cache_key, schedules)
+            return schedules
 
         except Exception as e:
-            print(f"❌ Error calling Claude: {e}")
+            log.error(f"❌ Error calling Claude: {e}")
             return []
 
-    def filter_best_schedules_per_month(self, all_schedules):
-        """Second pass: Use Claude to select the very best schedule link for each (location, month) combination"""
-        if not all_schedules:
-            return []
+    async def ask_claude_to_find_schedules_batch(self, site_crawls):
+        """Submit every site's analysis as one Message Batch (billed at half price) and wait for the results"""
+        all_schedules = []
+        pending = []
+        for site_name, crawl_data in site_crawls:
+            if not has_schedule_signal(crawl_data):
+                log.info(f"⏭️  Nothing schedule-like on {site_name}, leaving it out of the batch")
+                continue
 
-        print(f"\n🔍 Second Pass: Filtering {len(all_schedules)} schedules to find the best link per location per month...")
+            cache_key = self.schedules_cache_key(site_name, crawl_data)
+            cached = self.load_cached_schedules(cache_key)
+            if cached is not None:
+                log.info(f"♻️  {site_name} unchanged since Claude last analyzed it, reusing {len(cached)} schedules")
+                all_schedules.extend(cached)
+                continue
 
-        # Group schedules by ice_rink_name + month-year
-        location_month_groups = {}
-        for schedule in all_schedules:
-            ice_rink = schedule.get('ice_rink_name', 'Unknown')
-            month = schedule.get('month', 'Unknown')
-            year = schedule.get('year', 'Unknown')
-            key = f"{ice_rink} - {month} {year}"
+            pending.append((site_name, crawl_data, cache_key))
+
+        if not pending:
+            return all_schedules
+
+        # Batch custom_ids only allow [a-zA-Z0-9_-], so key requests by index and map back to site names
+        site_names = {}
+        cache_keys = {}
+        requests = []
+        for i, (site_name, crawl_data, cache_key) in enumerate(pending):
+            custom_id = f"site-{i}"
+            site_names[custom_id] = site_name
+            cache_keys[custom_id] = cache_key
+            requests.append({
+                "custom_id": custom_id,
+                "params": {
+                    "model": CLAUDE_MODEL,
+                    "max_tokens": SCHEDULES_MAX_TOKENS,
+                    "tools": [SCHEDULES_TOOL],
+                    "tool_choice": {"type": "tool", "name": SCHEDULES_TOOL["name"]},
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": self.build_schedule_prompt(site_name, crawl_data)
+                        }
+                    ]
+                }
+            })
+
+        messages = await self.run_message_batch(requests, "site analysis")
+        for custom_id, message in messages.items():
+            site_name = site_names.get(custom_id, 'Unknown')
+            log.info(f"\n🤖 Claude batch analysis complete for {site_name}")
+            log_token_usage(message)
+            schedules = self.schedules_from_message(message)
+            if message.stop_reason == "tool_use":
+                self.store_cached_schedules(cache_keys[custom_id], schedules)
+            all_schedules.extend(schedules)
+
+        return all_schedules
+
+    async def run_message_batch(self, requests, description, poll_interval=30):
+        """Run requests as one Message Batch (billed at half price) and return {custom_id: message} for those that succeeded"""
+        if not requests:
+            return {}
+
+        log.info(f"\n📦 Submitting {len(requests)} {description} requests to the Claude Message Batches API...")
+
+        # Batch calls don't go through the limiter, so they keep the SDK's retries
+        batches = self.claude_client.with_options(max_retries=2).messages.batches
+        messages = {}
+        try:
+            batch = await batches.create(requests=requests)
+            log.info(f"✅ Batch {batch.id} submitted")
+
+            while batch.processing_status != "ended":
+                await asyncio.sleep(poll_interval)
+                batch = await batches.retrieve(batch.id)
+                counts = batch.request_counts
+                log.info(f"⏳ Batch {batch.id}: {counts.processing} processing, {counts.succeeded} succeeded, {counts.errored} errored")
+
+            async for entry in await batches.results(batch.id):
+                if entry.result.type != "succeeded":
+                    log.error(f"❌ Batch request {entry.custom_id} for {description} did not succeed: {entry.result.type}")
+                    continue
+                messages[entry.custom_id] = entry.result.message
 
-            if key not in location_month_groups:
-                location_month_groups[key] = []
-            location_month_groups[key].append(schedule)
+        except Exception as e:
+            log.error(f"❌ Error running Claude batch for {description}: {e}")
 
-        print(f"📅 Found schedules for {len(location_month_groups)} location-month combination(s):")
-        for key in sorted(location_month_groups.keys()):
-            print(f"    • {key} ({len(location_month_groups[key])} schedules)")
+        return messages
 
-        filtered_schedules = []
+    def build_filter_prompt(self, location_month, schedules):
+        """Build the second-pass prompt content blocks asking Claude to pick the best of a group's schedules"""
+        # One compact object per line: readable for Claude without indent=2's whitespace tokens
+        schedules_json = "\n".join(
+            json.dumps(dict(schedule, index=i), separators=(',', ':'))
+            for i, schedule in enumerate(schedules)
+        )
 
-        for location_month, schedules in location_month_groups.items():
-            if len(schedules) == 1:
-                # Only one schedule for this location-month, but still check parent_link != schedule_link
-                schedule = schedules[0]
-                if schedule.get('parent_page_link') != schedule.get('schedule_link'):
-                    filtered_schedules.append(schedule)
-                    print(f"✅ {location_month}: Only 1 schedule found, keeping it")
-                else:
-                    print(f"⚠️  {location_month}: Skipping - parent_link same as schedule_link")
-                continue
-
-            print(f"\n🤖 Analyzing {len(schedules)} schedules for {location_month}...")
+        # Only the group details vary between calls; the criteria come first
+        return [
+            {
+                "type": "text",
+                "text": SCHEDULE_FILTER_INSTRUCTIONS
+            },
+            {
+                "type": "text",
+                "text": f"""GROUP DETAILS:
+LOCATION AND MONTH: {location_month}
 
-            # Create prompt for Claude to choose the best schedule
-            schedules_json = json.dumps(schedules, indent=2)
+SCHEDULES TO ANALYZE:
+{schedules_json}"""
+            }
+        ]
 
-            prompt = f"""You are analyzing multiple schedule links found for {location_month} ice rink schedules. Your job is to select the SINGLE BEST link that will help users find current ice skating schedules.
+    def selected_from_filter_message(self, location_month, schedules, message):
+        """Return the schedule Claude picked through the select_schedule tool call, or None"""
+        analysis = None
+        for block in message.content:
+            if block.type == "tool_use" and block.name == SELECT_SCHEDULE_TOOL["name"]:
+                analysis = block.input
+                break
+        if analysis is None:
+            log.error(f"❌ {location_month}: Claude response missing select_schedule tool call")
+            return None
 
-SCHEDULES TO ANALYZE:
-{schedules_json}
+        index = analysis.get('selected_index', -1)
+        reasoning = analysis.get('reasoning', 'No reasoning provided')
+        rejected_count = analysis.get('rejected_count', 0)
 
-SELECTION CRITERIA (in order of importance):
-1. MUST EXCLUDE: Links where parent_page_link is the same as schedule_link (these are usually navigation pages, not direct schedule documents)
-2. PREFER: Direct links to schedule documents (PDFs, ImageRepository documents, calendar viewers)
-3. PREFER: Links with "high" confidence over "medium" or "low"
-4. PREFER: Links that specifically mention the target month in their reasoning or URL
-5. PREFER: Links to actual schedule documents over general information pages
-6. AVOID: General navigation links, contact pages, or registration systems
+        if isinstance(index, int) and 0 <= index < len(schedules):
+            selected = schedules[index]
+            log.info(f"✅ {location_month}: Selected best schedule (rejected {rejected_count})")
+            log.info(f"   📄 Link: {selected.get('schedule_link', '')}")
+            log.info(f"   🧠 Reasoning: {reasoning}")
+            return selected
 
-TASK: Select the single best schedule link for {location_month}. If all links have parent_page_link = schedule_link, return null.
+        log.warning(f"❌ {location_month}: No valid schedules found (rejected {rejected_count})")
+        log.info(f"   🧠 Reasoning: {reasoning}")
+        return None
 
-Respond with valid JSON only:
-{{
-  "selected_schedule": <full_schedule_object_or_null>,
-  "reasoning": "<explanation_of_why_this_is_the_best_choice>",
-  "rejected_count": <number_of_schedules_rejected>
-}}"""
+    async def select_best_schedule(self, location_month, schedules):
+        """Ask Claude to pick the best of several schedules for one location-month"""
+        log.info(f"\n🤖 Analyzing {len(schedules)} schedules for {location_month}...")
+        prompt = self.build_filter_prompt(location_month, schedules)
 
-            try:
-                message = self.claude_client.messages.create(
-                    model="claude-opus-4-5-20251101",
-                    max_tokens=1000,
+        try:
+            message = await retry_async(
+                lambda: self.claude_limiter.run(lambda: self.claude_client.messages.create(
+                    model=CLAUDE_MODEL,
+                    max_tokens=FILTER_MAX_TOKENS,
+                    tools=[SELECT_SCHEDULE_TOOL],
+                    tool_choice={"type": "tool", "name": SELECT_SCHEDULE_TOOL["name"]},
                     messages=[
                         {
                             "role": "user",
                             "content": prompt
                         }
                     ]
-                )
+                )),
+                f"Claude filtering of {location_month}",
+                CLAUDE_RETRY_ERRORS,
+                retry_if=is_transient_claude_error
+            )
+        except Exception as e:
+            log.error(f"❌ {location_month}: Error calling Claude for filtering: {e}")
+            return None
 
-                response_text = message.content[0].text.strip()
+        return self.selected_from_filter_message(location_month, schedules, message)
 
-                # Parse Claude's JSON response
-                try:
-                    json_start = response_text.find('{')
-                    json_end = response_text.rfind('}') + 1
+    async def filter_best_schedules_per_month(self, all_schedules, use_llm=False, use_batch=False):
+        """Second pass: select the very best schedule link for each (location, month) combination
 
-                    if json_start != -1 and json_end > json_start:
-                        json_text = response_text[json_start:json_end]
-                        analysis = json.loads(json_text)
+        Groups are ranked with schedule_score unless use_llm asks Claude to pick.
+        """
+        if not all_schedules:
+            return []
 
-                        selected = analysis.get('selected_schedule')
-                        reasoning = analysis.get('reasoning', 'No reasoning provided')
-                        rejected_count = analysis.get('rejected_count', 0)
+        log.info(f"\n🔍 Second Pass: Filtering {len(all_schedules)} schedules to find the best link per location per month...")
+
+        # Group schedules by (ice_rink_name, month, year)
+        location_month_groups = defaultdict(list)
+        for schedule in all_schedules:
+            location_month_groups[(
+                schedule.get('ice_rink_name', 'Unknown'),
+                schedule.get('month', 'Unknown'),
+                str(schedule.get('year', 'Unknown'))  # 2026 and "2026" are the same month
+            )].append(schedule)
 
-                        if selected:
-                            filtered_schedules.append(selected)
-                            print(f"✅ {location_month}: Selected best schedule (rejected {rejected_count})")
-                            print(f"   📄 Link: {selected.get('schedule_link', '')}")
-                            print(f"   🧠 Reasoning: {reasoning}")
-                        else:
-                            print(f"❌ {location_month}: No valid schedules found (rejected {rejected_count})")
-                            print(f"   🧠 Reasoning: {reasoning}")
+        # Human-readable "rink - month year" labels, only needed for logging and prompts
+        labels = {key: f"{key[0]} - {key[1]} {key[2]}" for key in location_month_groups}
 
-                    else:
-                        print(f"❌ {location_month}: No valid JSON in Claude response")
+        log.info(f"📅 Found schedules for {len(location_month_groups)} location-month combination(s):")
+        for key in sorted(location_month_groups, key=labels.get):
+            log.info(f"    • {labels[key]} ({len(location_month_groups[key])} schedules)")
 
-                except json.JSONDecodeError as e:
-                    print(f"❌ {location_month}: JSON parsing error: {e}")
+        filtered_schedules = []
+        contested_groups = []
+
+        for key, schedules in location_month_groups.items():
+            location_month = labels[key]
+            if len(schedules) == 1:
+                # Only one schedule for this location-month, but still check parent_link != schedule_link
+                schedule = schedules[0]
+                if schedule.get('parent_page_link') != schedule.get('schedule_link'):
+                    filtered_schedules.append(schedule)
+                    log.info(f"✅ {location_month}: Only 1 schedule found, keeping it")
+                else:
+                    log.warning(f"⚠️  {location_month}: Skipping - parent_link same as schedule_link")
+                continue
 
-            except Exception as e:
-                print(f"❌ {location_month}: Error calling Claude for filtering: {e}")
+            contested_groups.append((location_month, schedules))
 
-        print(f"\n📊 Second pass complete: {len(all_schedules)} → {len(filtered_schedules)} schedules")
+        if not use_llm:
+            for location_month, schedules in contested_groups:
+                best = max(schedules, key=schedule_score)
+                if best.get('parent_page_link') == best.get('schedule_link'):
+                    log.warning(f"❌ {location_month}: No valid schedules found (rejected {len(schedules)})")
+                    continue
+                filtered_schedules.append(best)
+                log.info(f"✅ {location_month}: Selected best schedule (rejected {len(schedules) - 1})")
+                log.info(f"   📄 Link: {best.get('schedule_link', '')}")
+        elif use_batch:
+            # Batch ids are positional, like the first pass
+            requests = [
+                {
+                    "custom_id": f"group-{i}",
+                    "params": {
+                        "model": CLAUDE_MODEL,
+                        "max_tokens": FILTER_MAX_TOKENS,
+                        "tools": [SELECT_SCHEDULE_TOOL],
+                        "tool_choice": {"type": "tool", "name": SELECT_SCHEDULE_TOOL["name"]},
+                        "messages": [
+                            {
+                                "role": "user",
+                                "content": self.build_filter_prompt(location_month, schedules)
+                            }
+                        ]
+                    }
+                }
+                for i, (location_month, schedules) in enumerate(contested_groups)
+            ]
+            messages = await self.run_message_batch(requests, "schedule filtering")
+            for i, (location_month, schedules) in enumerate(contested_groups):
+                message = messages.get(f"group-{i}")
+                if message is None:
+                    log.error(f"❌ {location_month}: No batch result for filtering")
+                    continue
+                selected = self.selected_from_filter_message(location_month, schedules, message)
+                if selected:
+                    filtered_schedules.append(selected)
+        else:
+            # Contested groups are independent, so ask about all of them at once;
+            # claude_limiter still caps how many requests are in flight
+            selections = await asyncio.gather(*[
+                self.select_best_schedule(location_month, schedules)
+                for location_month, schedules in contested_groups
+            ])
+            filtered_schedules.extend(selected for selected in selections if selected)
+
+        log.info(f"\n📊 Second pass complete: {len(all_schedules)} → {len(filtered_schedules)} schedules")
         return filtered_schedules
 
     def add_static_schedules(self, schedules):
         """Add hard-coded schedule links that never change"""
-        print(f"\n📌 Adding static/hard-coded schedule links...")
-
-        current_date = datetime.now()
-        current_month = current_date.strftime('%B')
-        current_year = current_date.year
-        next_month_date = datetime(current_year if current_date.month < 12 else current_year + 1,
-                                 current_date.month + 1 if current_date.month < 12 else 1, 1)
-        next_month = next_month_date.strftime('%B')
-        next_year = next_month_date.year
+        log.info(f"\n📌 Adding static/hard-coded schedule links...")
 
+        dates = self.date_ctx
         static_schedules = [
-            {
-                "schedule_link": "https://centene.finnlyconnect.com/registration/activityitem/4762",
-                "parent_page_link": "https://www.centenecommunityicecenter.com/ice-skating/public-skating-1",
-                "ice_rink_name": "Centene Community Ice Center",
-                "year": current_year,
-                "month": current_month,
-                "schedule_type": "Public Skating Registration",
-                "confidence": "high",
-                "reasoning": "Hard-coded static link that never changes - direct registration page for public skating"
-            },
-            {
-                "schedule_link": "https://centene.finnlyconnect.com/registration/activityitem/4762",
-                "parent_page_link": "https://www.centenecommunityicecenter.com/ice-skating/public-skating-1",
-                "ice_rink_name": "Centene Community Ice Center",
-                "year": next_year,
-                "month": next_month,
-                "schedule_type": "Public Skating Registration",
-                "confidence": "high",
-                "reasoning": "Hard-coded static link that never changes - direct registration page for public skating"
-            }
+            dict(template, year=year, month=month)
+            for template in STATIC_SCHEDULES
+            for year, month in [
+                (dates['current_year'], dates['current_month']),
+                (dates['next_year'], dates['next_month'])
+            ]
         ]
 
         # Add static schedules to the results
         schedules.extend(static_schedules)
-        print(f"✅ Added {len(static_schedules)} static schedule(s) for Centene Community Ice Center")
+        log.info(f"✅ Added {len(static_schedules)} static schedule(s) for Centene Community Ice Center")
 
         return schedules
 
-    async def process_all_sites(self):
-        """Process all sites and collect schedule information using Crawl4AI"""
-        print("\n" + "=" * 80)
-        print("🚀 SIRS Admin CLI - Starting schedule collection with Crawl4AI")
-        print("=" * 80)
+    async def crawl_site_bounded(self, crawler, site, semaphore, position, total):
+        """Crawl a single site, holding one of the shared semaphore's slots only while crawling"""
+        async with semaphore:
+            log.info(f"\n📍 Crawling site {position}/{total}")
+
+            # Plain HTTP for static sites, Crawl4AI for clean content from JS-heavy ones
+            started = time.perf_counter()
+            crawl_data = await self.crawl_site(crawler, site)
+            self.crawl_seconds[site.get('name', 'Unknown')] = time.perf_counter() - started
+
+        if not crawl_data:
+            log.warning(f"⚠️  Could not crawl content for {site.get('name', 'Unknown')}")
+        return crawl_data
+
+    async def process_site(self, crawler, site, semaphore, position, total):
+        """Crawl a single site and ask Claude for its schedules"""
+        crawl_data = await self.crawl_site_bounded(crawler, site, semaphore, position, total)
+        if not crawl_data:
+            return []
+
+        # The crawl slot is already released, so the next site starts crawling
+        # while Claude analyzes this one's clean content
+        return await self.ask_claude_to_find_schedules(
+            site.get('name', 'Unknown'),
+            crawl_data
+        )
+
+    async def process_all_sites(self, max_concurrency=5, use_batch=False, use_llm_filter=False, force_refresh=False):
+        """Process all sites concurrently and collect schedule information using Crawl4AI
+
+        force_refresh ignores cached crawls and Claude results (fresh ones are still cached).
+        """
+        log.info("\n" + "=" * 80)
+        log.info("🚀 SIRS Admin CLI - Starting schedule collection with Crawl4AI")
+        log.info("=" * 80)
+
+        # Fix the target months once so every site's prompt (and the static
+        # links) agree even if the run crosses midnight
+        self.date_ctx = schedule_dates()
+        self.force_refresh = force_refresh
+        self.crawl_seconds = {}
 
         # Load sites configuration
         sites = self.load_sites_config()
         if not sites:
-            print("❌ No sites to process")
+            log.error("❌ No sites to process")
             return []
 
-        all_schedules = []
-
-        for i, site in enumerate(sites, 1):
-            print(f"\n📍 Processing site {i}/{len(sites)}")
+        # Configure browser for crawling; Crawl4AI's own per-page chatter is only
+        # worth its cost when debugging
+        browser_config = BrowserConfig(
+            headless=True,
+            light_mode=True,  # Skip Chromium background services we never use
+            verbose=log.isEnabledFor(logging.DEBUG)
+        )
+
+        # Crawling is network-bound, so run sites concurrently; the semaphore
+        # caps how many pages are open at once in the shared browser
+        semaphore = asyncio.Semaphore(max_concurrency)
+        log.info(f"⚡ Crawling {len(sites)} sites with up to {max_concurrency} at a time")
+
+        # One browser for the whole run instead of a cold Chromium launch per site,
+        # plus one HTTP client for static sites and cache-validation requests
+        async with AsyncWebCrawler(config=browser_config) as crawler, \
+                httpx.AsyncClient(follow_redirects=True, timeout=10) as http_client:
+            self.http_client = http_client
+            crawler.crawler_strategy.set_hook("on_page_context_created", block_heavy_resources)
+            if use_batch:
+                # Crawl everything first, then hand all prompts to Claude as one batch
+                tasks = [
+                    self.crawl_site_bounded(crawler, site, semaphore, i, len(sites))
+                    for i, site in enumerate(sites, 1)
+                ]
+            else:
+                tasks = [
+                    self.process_site(crawler, site, semaphore, i, len(sites))
+                    for i, site in enumerate(sites, 1)
+                ]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
 
-            # Use Crawl4AI to get clean, LLM-optimized content
-            crawl_data = await self.crawl_site_with_crawl4ai(site)
+        # Slowest first, to spot sites worth a "needs_js": false or their own "page_timeout"
+        log.info("\n⏱️  Crawl times:")
+        for name, seconds in sorted(self.crawl_seconds.items(), key=lambda item: item[1], reverse=True):
+            log.info(f"    {seconds:5.1f}s  {name}")
 
-            if crawl_data:
-                # Use Claude to analyze the clean content and find schedules
-                schedules = self.ask_claude_to_find_schedules(
-                    site.get('name', 'Unknown'),
-                    crawl_data
-                )
-                all_schedules.extend(schedules)
+        all_schedules = []
+        site_crawls = []
+        for site, result in zip(sites, results):
+            if isinstance(result, Exception):
+                log.error(f"❌ Error processing {site.get('name', 'Unknown')}: {result}")
+                continue
+            if use_batch:
+                if result:
+                    site_crawls.append((site.get('name', 'Unknown'), result))
             else:
-                print(f"⚠️  Could not crawl content for {site.get('name', 'Unknown')}")
+                all_schedules.extend(result)
+
+        if use_batch:
+            all_schedules = await self.ask_claude_to_find_schedules_batch(site_crawls)
 
-        print(f"\n" + "=" * 80)
-        print(f"✅ First pass complete! Found {len(all_schedules)} total schedules")
-        print("=" * 80)
+        log.info(f"\n" + "=" * 80)
+        log.info(f"✅ First pass complete! Found {len(all_schedules)} total schedules")
+        log.info("=" * 80)
 
         # Second pass: Filter to best schedule per month
         if all_schedules:
-            filtered_schedules = self.filter_best_schedules_per_month(all_schedules)
+            filtered_schedules = await self.filter_best_schedules_per_month(
+                all_schedules,
+                use_llm=use_llm_filter,
+                use_batch=use_batch
+            )
 
             # Add static/hard-coded schedules
             final_schedules = self.add_static_schedules(filtered_schedules)
 
-            print(f"\n" + "=" * 80)
-            print(f"🎯 Final results: {len(final_schedules)} high-quality schedules (including static links)")
-            print("=" * 80)
+            log.info(f"\n" + "=" * 80)
+            log.info(f"🎯 Final results: {len(final_schedules)} high-quality schedules (including static links)")
+            log.info("=" * 80)
             return final_schedules
         else:
             # Even if no dynamic schedules found, still add static ones
@@ -533,12 +1521,12 @@ Respond with valid JSON only:
 
     def save_results(self, schedules, output_file="schedules.json"):
         """Save results to JSON file"""
-        print(f"\n💾 Saving results to {output_file}...")
+        log.info(f"\n💾 Saving results to {output_file}...")
 
         output_data = {
             "timestamp": datetime.now().isoformat(),
             "total_schedules": len(schedules),
-            "description": "High-quality ice rink schedules selected via two-pass AI filtering plus static hard-coded links",
+            "description": "High-quality ice rink schedules selected via two-pass filtering plus static hard-coded links",
             "filtering_notes": "Second pass removed duplicates and selected best link per (location, month) combination where parent_page_link != schedule_link. Static schedules added for reliable links that never change.",
             "schedules": schedules
         }
@@ -546,34 +1534,71 @@ Respond with valid JSON only:
         with open(output_file, 'w') as f:
             json.dump(output_data, f, indent=2)
 
-        print(f"✅ Results saved to {output_file}")
+        log.info(f"✅ Results saved to {output_file}")
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Collect ice rink schedule links with Crawl4AI and Claude")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Analyze sites through the Claude Message Batches API (half price, but can take a while to finish)"
+    )
+    parser.add_argument(
+        "--llm-filter",
+        action="store_true",
+        help="Ask Claude to pick each location-month's best schedule instead of ranking them by rule"
+    )
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Re-crawl every site and re-ask Claude, ignoring cached results"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=5,
+        metavar="N",
+        help="How many sites to crawl at once in the shared browser (default: 5)"
+    )
+    return parser.parse_args()
 
 async def main():
     """Main entry point"""
+    args = parse_args()
     finder = IceScheduleFinder()
 
     try:
         # Process all sites and collect schedules
-        schedules = await finder.process_all_sites()
+        schedules = await finder.process_all_sites(
+            max_concurrency=max(1, args.max_concurrency),
+            use_batch=args.batch,
+            use_llm_filter=args.llm_filter,
+            force_refresh=args.force_refresh
+        )
 
         # Save results
         if schedules:
             finder.save_results(schedules)
 
             # Print summary
-            print(f"\n📊 FINAL SUMMARY (Two-Pass Filtered Results):")
+            log.info(f"\n📊 FINAL SUMMARY (Two-Pass Filtered Results):")
             for schedule in schedules:
-                print(f"   • {schedule.get('ice_rink_name', 'Unknown')} - {schedule.get('month', '?')} {schedule.get('year', '?')} - {schedule.get('schedule_type', 'Unknown')}")
-                print(f"     📄 Schedule: {schedule.get('schedule_link', '')}")
-                print(f"     🏠 Parent: {schedule.get('parent_page_link', '')}")
-                print(f"     🎯 Confidence: {schedule.get('confidence', 'unknown')}")
+                log.info(f"   • {schedule.get('ice_rink_name', 'Unknown')} - {schedule.get('month', '?')} {schedule.get('year', '?')} - {schedule.get('schedule_type', 'Unknown')}")
+                log.info(f"     📄 Schedule: {schedule.get('schedule_link', '')}")
+                log.info(f"     🏠 Parent: {schedule.get('parent_page_link', '')}")
+                log.info(f"     🎯 Confidence: {schedule.get('confidence', 'unknown')}")
         else:
-            print("\n⚠️  No schedules found")
+            log.warning("\n⚠️  No schedules found")
 
     except KeyboardInterrupt:
-        print("\n⚠️  Interrupted by user")
+        log.warning("\n⚠️  Interrupted by user")
     except Exception as e:
-        print(f"\n❌ Error: {e}")
+        log.error(f"\n❌ Error: {e}")
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    listener = setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        listener.stop()
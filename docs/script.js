@@ -1,9 +1,24 @@
+// Every card's modal text, keyed by modal id; parsed on first use
+let modalData = null;
+
 function openModal(modalId) {
-    document.getElementById(modalId).style.display = "block";
+    if (modalData === null) {
+        modalData = JSON.parse(document.getElementById('modal-data').textContent);
+    }
+    const entry = modalData[modalId];
+    if (!entry) {
+        return;
+    }
+
+    // One shared modal for the whole page, filled in as plain text
+    document.getElementById('reasoning-modal-title').textContent = entry.title;
+    document.getElementById('reasoning-modal-confidence').textContent = entry.confidence;
+    document.getElementById('reasoning-modal-reasoning').textContent = entry.reasoning;
+    document.getElementById('reasoning-modal').style.display = "block";
 }
 
-function closeModal(modalId) {
-    document.getElementById(modalId).style.display = "none";
+function closeModal() {
+    document.getElementById('reasoning-modal').style.display = "none";
 }
 
 // Close modal when clicking outside of it
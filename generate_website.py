@@ -4,56 +4,56 @@ SIRS Website Generator
 Generates a static HTML website from the schedules JSON data
 """
 
+import gzip
+import hashlib
+import html
 import json
 import os
-from datetime import datetime
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import attrgetter
+from typing import NamedTuple
 
-def get_cache_version():
-    """Get a cache version based on current timestamp"""
-    return str(int(datetime.now().timestamp()))
+# orjson parses large schedule files several times faster when it happens to be
+# installed; it isn't required. Its JSONDecodeError subclasses json's.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
-def load_schedules(schedules_file="schedules.json"):
-    """Load schedules data from JSON file"""
-    try:
-        with open(schedules_file, 'r') as f:
-            data = json.load(f)
-        return data.get('schedules', [])
-    except FileNotFoundError:
-        print(f"❌ Schedules file {schedules_file} not found")
-        return []
-    except json.JSONDecodeError as e:
-        print(f"❌ Error parsing {schedules_file}: {e}")
-        return []
+# Likewise optional: schedule archives past this size are parsed one entry at
+# a time with ijson, so the whole JSON tree is never in memory at once
+try:
+    import ijson
+except ImportError:
+    ijson = None
+STREAM_PARSE_MIN_BYTES = 4 * 1024 * 1024
+SCHEDULES_PARSE_ERRORS = (json.JSONDecodeError,) + ((ijson.JSONError,) if ijson else ())
 
-def generate_html(schedules, version):
-    """Generate HTML content from schedules data with cache busting"""
-
-    # Group schedules by rink name
-    rinks = {}
-    for schedule in schedules:
-        rink_name = schedule.get('ice_rink_name', 'Unknown')
-        if rink_name not in rinks:
-            rinks[rink_name] = []
-        rinks[rink_name].append(schedule)
-
-    # Sort rinks alphabetically
-    rinks = dict(sorted(rinks.items()))
-
-    # Sort schedules within each rink by year and month
-    month_order = {
-        'january': 1, 'february': 2, 'march': 3, 'april': 4,
-        'may': 5, 'june': 6, 'july': 7, 'august': 8,
-        'september': 9, 'october': 10, 'november': 11, 'december': 12
-    }
-
-    for rink_name in rinks:
-        rinks[rink_name].sort(key=lambda x: (
-            x.get('year', 0),
-            month_order.get(x.get('month', '').lower(), 0)
-        ))
+# The rendered page body from the last run, keyed by a digest of the schedules
+# and this script, so re-running with unchanged schedules skips rendering
+BODY_CACHE_FILE = os.path.join(os.getenv('SIRS_CACHE_DIR', '.sirs_cache'), 'page_body.html')
+
+# Also write docs/index.html.gz for hosts that serve precompressed files
+# (e.g. nginx gzip_static). GitHub Pages compresses on the fly and ignores it
+PRECOMPRESS = os.getenv('SIRS_PRECOMPRESS', '').lower() in ('1', 'true', 'yes')
+
+# Pages with at least this many schedules render their rinks in parallel
+# worker processes
+PARALLEL_RENDER_MIN_SCHEDULES = 5000
 
-    # Generate HTML with external assets and cache busting
-    html = f"""<!DOCTYPE html>
+# Digest of the inputs the current docs/index.html was built from. Jekyll
+# doesn't publish dotfiles, so it stays out of the deployed site
+BUILD_HASH_FILE = os.path.join('docs', '.build-hash')
+BUILD_INPUTS = ('schedules.json', __file__, os.path.join('docs', 'styles.css'), os.path.join('docs', 'script.js'))
+
+# Page markup, filled in with %-formatting from a dict (measurably quicker
+# than str.format_map in the card loop). Only the values change between
+# cards, so the markup itself lives here rather than inside the loops
+PAGE_HEADER = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -66,93 +66,316 @@ def generate_html(schedules, version):
     <meta http-equiv="Expires" content="0">
 
     <!-- External stylesheets and scripts with cache busting -->
-    <link rel="stylesheet" href="styles.css?v={version}">
+    <link rel="stylesheet" href="styles.css?v=%(version)s">
 </head>
 <body>
     <div class="container">"""
 
-    if not schedules:
-        html += """
+NO_SCHEDULES = """
         <div class="no-schedules">
             <h2>No schedules found</h2>
             <p>Run the admin CLI to collect ice rink schedules.</p>
         </div>"""
-    else:
-        for rink_name, rink_schedules in rinks.items():
-            html += f"""
+
+RINK_HEADER = """
     <div class="rink-section">
-        <h2 class="rink-header">{rink_name}</h2>
+        <h2 class="rink-header">%(rink_name)s</h2>
         <div class="schedule-grid">"""
 
-            # Store modals to render outside the grid
-            modals_html = ""
+# Calendar and house icons for the card's two links (no % signs, so safe to
+# splice into a format template)
+SCHEDULE_ICON = """                        <svg width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
+                            <path d="M3.5 0a.5.5 0 0 1 .5.5V1h8V.5a.5.5 0 0 1 1 0V1h1a2 2 0 0 1 2 2v11a2 2 0 0 1-2 2H2a2 2 0 0 1-2-2V3a2 2 0 0 1 2-2h1V.5a.5.5 0 0 1 .5-.5zM1 4v10a1 1 0 0 0 1 1h12a1 1 0 0 0 1-1V4H1z"/>
+                        </svg>
+"""
 
-            for i, schedule in enumerate(rink_schedules):
-                month = schedule.get('month', 'Unknown')
-                year = schedule.get('year', 'Unknown')
-                schedule_url = schedule.get('schedule_link', '#')
-                parent_url = schedule.get('parent_page_link', '#')
-                confidence = schedule.get('confidence', 'unknown')
-                reasoning = schedule.get('reasoning', 'No reasoning provided')
-                modal_id = f"modal-{rink_name.replace(' ', '')}-{i}"
+MAIN_SITE_ICON = """                        <svg width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
+                            <path d="M8.707 1.5a1 1 0 0 0-1.414 0L.646 8.146a.5.5 0 0 0 .708.708L2 8.207V13.5A1.5 1.5 0 0 0 3.5 15h9a1.5 1.5 0 0 0 1.5-1.5V8.207l.646.647a.5.5 0 0 0 .708-.708L13 5.793V2.5a.5.5 0 0 0-.5-.5h-1a.5.5 0 0 0-.5.5v1.293L8.707 1.5ZM13 7.207V13.5a.5.5 0 0 1-.5.5h-9a.5.5 0 0 1-.5-.5V7.207l5-5 5 5Z"/>
+                        </svg>
+"""
 
-                html += f"""
+# The card's icons never vary, so they are spliced into the card template once
+# here and formatting only scans them as literal text
+SCHEDULE_CARD = ("""
             <div class="schedule-card">
                 <div class="schedule-header">
-                    <div class="schedule-title">{month} {year}</div>
-                    <div class="confidence {confidence}" onclick="openModal('{modal_id}')">
-                        {confidence.title()}
+                    <div class="schedule-title">%(month)s %(year)s</div>
+                    <div class="confidence %(confidence)s" onclick="openModal('%(modal_id)s')">
+                        %(confidence_title)s
                     </div>
                 </div>
                 <div class="links-container">
-                    <a href="{schedule_url}" target="_blank" class="schedule-link primary">
-                        <svg width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
-                            <path d="M3.5 0a.5.5 0 0 1 .5.5V1h8V.5a.5.5 0 0 1 1 0V1h1a2 2 0 0 1 2 2v11a2 2 0 0 1-2 2H2a2 2 0 0 1-2-2V3a2 2 0 0 1 2-2h1V.5a.5.5 0 0 1 .5-.5zM1 4v10a1 1 0 0 0 1 1h12a1 1 0 0 0 1-1V4H1z"/>
-                        </svg>
-                        Schedule
+                    <a href="%(schedule_url)s" target="_blank" class="schedule-link primary">
+""" + SCHEDULE_ICON + """                        Schedule
                     </a>
-                    <a href="{parent_url}" target="_blank" class="schedule-link secondary">
-                        <svg width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
-                            <path d="M8.707 1.5a1 1 0 0 0-1.414 0L.646 8.146a.5.5 0 0 0 .708.708L2 8.207V13.5A1.5 1.5 0 0 0 3.5 15h9a1.5 1.5 0 0 0 1.5-1.5V8.207l.646.647a.5.5 0 0 0 .708-.708L13 5.793V2.5a.5.5 0 0 0-.5-.5h-1a.5.5 0 0 0-.5.5v1.293L8.707 1.5ZM13 7.207V13.5a.5.5 0 0 1-.5.5h-9a.5.5 0 0 1-.5-.5V7.207l5-5 5 5Z"/>
-                        </svg>
-                        Main Site
+                    <a href="%(parent_url)s" target="_blank" class="schedule-link secondary">
+""" + MAIN_SITE_ICON + """                        Main Site
                     </a>
                 </div>
-            </div>"""
-
-                # Add modal to modals collection
-                modals_html += f"""
-        <!-- Modal for {month} {year} reasoning -->
-        <div id="{modal_id}" class="modal">
-            <div class="modal-content">
-                <span class="close" onclick="closeModal('{modal_id}')">&times;</span>
-                <h3>{rink_name} - {month} {year}</h3>
-                <p><strong>Confidence:</strong> {confidence.title()}</p>
-                <p><strong>Reasoning:</strong> {reasoning}</p>
-            </div>
-        </div>"""
+            </div>""")
 
-            html += """
+RINK_FOOTER = """
         </div>
     </div>"""
 
-            # Add all modals for this rink outside the section
-            html += modals_html
+# One reasoning modal for the whole page; script.js fills it in from the
+# embedded modal data when a confidence chip is clicked
+PAGE_FOOTER = """
+    </div>
 
-    html += f"""
+    <div id="reasoning-modal" class="modal">
+        <div class="modal-content">
+            <span class="close" onclick="closeModal()">&times;</span>
+            <h3 id="reasoning-modal-title"></h3>
+            <p><strong>Confidence:</strong> <span id="reasoning-modal-confidence"></span></p>
+            <p><strong>Reasoning:</strong> <span id="reasoning-modal-reasoning"></span></p>
+        </div>
     </div>
 
-    <script src="script.js?v={version}"></script>
+    <script src="script.js?v=%(version)s"></script>
 </body>
 </html>"""
 
-    return html
+# The indentation above is for reading this file. Browsers collapse any run
+# of whitespace between tags anyway, so it is dropped from the emitted page,
+# along with blank lines (about a quarter of the page's bytes)
+PAGE_HEADER, NO_SCHEDULES, RINK_HEADER, SCHEDULE_CARD, RINK_FOOTER, PAGE_FOOTER = (
+    re.sub(r'\n\s+', '\n', markup)
+    for markup in (PAGE_HEADER, NO_SCHEDULES, RINK_HEADER, SCHEDULE_CARD, RINK_FOOTER, PAGE_FOOTER)
+)
+
+def escape_html(value):
+    """value as text that is safe inside HTML element content or a quoted attribute"""
+    # html.escape's chained str.replace is far quicker than a translate table
+    return html.escape(str(value))
+
+# Links may only point at web pages: escaping alone would leave a javascript:
+# or data: URL from a crawled page or from Claude intact in the href
+WEB_URL = re.compile(r'https?://', re.IGNORECASE)
+
+def safe_url(value):
+    """value as an escaped href if it is an http(s) URL, otherwise '#'"""
+    url = str(value).strip()
+    return escape_html(url) if WEB_URL.match(url) else '#'
+
+# <, > and & as JSON escapes, so the modal data can't close its <script> element
+SCRIPT_JSON_ESCAPES = str.maketrans({'<': '\\u003c', '>': '\\u003e', '&': '\\u0026'})
+
+def modal_data_script(modals):
+    """The <script> element holding every card's modal text, keyed by modal id"""
+    data = json.dumps(modals, ensure_ascii=False, separators=(',', ':')).translate(SCRIPT_JSON_ESCAPES)
+    return f'\n<script type="application/json" id="modal-data">{data}</script>'
+
+def get_cache_version():
+    """Get a cache version based on current timestamp"""
+    return str(time.time_ns() // 1_000_000_000)
+
+# Month numbers by the first three letters of the name, which are unique and
+# also cover abbreviations like "Sept"
+MONTH_NUMBERS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# Display labels for the confidence levels Claude assigns; anything else is title-cased
+CONFIDENCE_LABELS = {'high': 'High', 'medium': 'Medium', 'low': 'Low', 'unknown': 'Unknown'}
+# (label, chip class, chip label) per level, the last two already escaped for
+# the card markup, so known levels cost one lookup and no escaping per card
+CONFIDENCE_CHIPS = {level: (label, escape_html(level), escape_html(label)) for level, label in CONFIDENCE_LABELS.items()}
+
+class Schedule(NamedTuple):
+    """The fields of one schedules.json entry that the page shows, with their fallbacks"""
+    ice_rink_name: str = 'Unknown'
+    month: str = 'Unknown'
+    year: int = 0
+    schedule_link: str = '#'
+    parent_page_link: str = '#'
+    confidence: str = 'unknown'
+    reasoning: str = 'No reasoning provided'
+    # Derived from month once at load time, for sorting
+    month_number: int = 0
+
+# C-implemented sort and grouping keys: no Python frame per schedule
+SCHEDULE_SORT_KEY = attrgetter('ice_rink_name', 'year', 'month_number')
+RINK_NAME = attrgetter('ice_rink_name')
+# A card's fields by name, fetched in one call
+CARD_FIELDS = attrgetter('month', 'year', 'schedule_link', 'parent_page_link', 'confidence', 'reasoning')
+
+def schedule_from_row(row):
+    """Schedule for one schedules.json entry, ignoring keys the page doesn't show"""
+    fields = {field: row[field] for field in Schedule._fields if field in row}
+    fields['month_number'] = MONTH_NUMBERS.get(str(fields.get('month', ''))[:3].lower(), 0)
+    return Schedule(**fields)
+
+def load_schedules(schedules_file="schedules.json"):
+    """Load schedules data from JSON file"""
+    try:
+        if ijson and os.path.getsize(schedules_file) >= STREAM_PARSE_MIN_BYTES:
+            # use_float: floats like the whole-file parsers give, not Decimals,
+            # which the body cache's json.dumps would reject
+            with open(schedules_file, 'rb') as f:
+                return [schedule_from_row(row) for row in ijson.items(f, 'schedules.item', use_float=True)]
+
+        # One read of the raw bytes; both parsers take UTF-8 bytes directly,
+        # skipping the text layer's incremental decode
+        with open(schedules_file, 'rb') as f:
+            data = json_loads(f.read())
+        # Read each entry's fields once into a tuple; the renderer then uses
+        # attribute access instead of repeated dict.get calls with defaults
+        return [schedule_from_row(row) for row in data.get('schedules', [])]
+    except FileNotFoundError:
+        print(f"❌ Schedules file {schedules_file} not found")
+        return []
+    except SCHEDULES_PARSE_ERRORS as e:
+        print(f"❌ Error parsing {schedules_file}: {e}")
+        return []
+
+def render_cards(rink_index, rink_name, rink_schedules):
+    """Render one rink's schedule cards as (cards_html, modals), modals mapping each card's modal id to its modal text"""
+    card_parts = []
+    # Modal text goes out once as JSON for the page's single modal, so it
+    # stays unescaped here; script.js only ever assigns it as textContent
+    modals = {}
+
+    # Each Schedule's fallbacks were already filled in at load time
+    for i, schedule in enumerate(rink_schedules):
+        month, year, schedule_link, parent_page_link, confidence, reasoning = CARD_FIELDS(schedule)
+        year = year or 'Unknown'
+        chip = CONFIDENCE_CHIPS.get(confidence)
+        if chip is None:
+            label = str(confidence).title()
+            chip = (label, escape_html(confidence), escape_html(label))
+        confidence_title, confidence_class, confidence_label = chip
+        # Ids come from the rink's place on the page rather than its name, so
+        # they're unique page-wide and safe inside the onclick JS string
+        modal_id = f"modal-{rink_index}-{i}"
+        # Rink names, URLs and Claude's reasoning are all untrusted text, so
+        # each is escaped exactly once (and URLs are limited to http(s))
+        card_parts.append(SCHEDULE_CARD % dict(
+            month=escape_html(month),
+            year=escape_html(year),
+            schedule_url=safe_url(schedule_link),
+            parent_url=safe_url(parent_page_link),
+            confidence=confidence_class,
+            confidence_title=confidence_label,
+            modal_id=modal_id
+        ))
+        modals[modal_id] = {
+            'title': f"{rink_name} - {month} {year}",
+            'confidence': confidence_title,
+            'reasoning': str(reasoning)
+        }
+
+    return "".join(card_parts), modals
+
+def render_rink(rink_index, rink_name, rink_schedules):
+    """Render the rink_index'th rink's section (header and card grid) as (section_html, modals)"""
+    cards, modals = render_cards(rink_index, rink_name, rink_schedules)
+    return "".join([
+        RINK_HEADER % {'rink_name': escape_html(rink_name)},
+        cards,
+        RINK_FOOTER
+    ]), modals
+
+def render_sections(schedules):
+    """Yield the page body between header and footer (the part that depends on the schedules) one rink at a time"""
+    if not schedules:
+        yield NO_SCHEDULES
+        return
+
+    # One sort by (rink, year, month) leaves every rink's schedules contiguous
+    # and in order, so grouping is a single groupby walk
+    rinks = [
+        (rink_name, list(rink_schedules))
+        for rink_name, rink_schedules in groupby(sorted(schedules, key=SCHEDULE_SORT_KEY), key=RINK_NAME)
+    ]
+
+    # Rinks alphabetically. Each rink renders independently, so a big enough
+    # page is split across processes; below that, pool startup costs more than it saves
+    rink_names, rink_schedule_lists = zip(*rinks)
+    modals = {}
+    cpus = os.cpu_count() or 1
+    if len(schedules) >= PARALLEL_RENDER_MIN_SCHEDULES and len(rink_names) > 1 and cpus > 1:
+        # Hand each worker several rinks per round trip, about four batches
+        # per core, so many small rinks don't each pay for their own IPC
+        chunksize = max(1, len(rink_names) // (cpus * 4))
+        with ProcessPoolExecutor() as executor:
+            for section, rink_modals in executor.map(render_rink, range(len(rink_names)), rink_names, rink_schedule_lists, chunksize=chunksize):
+                modals.update(rink_modals)
+                yield section
+    else:
+        for section, rink_modals in map(render_rink, range(len(rink_names)), rink_names, rink_schedule_lists):
+            modals.update(rink_modals)
+            yield section
+
+    # Every card's modal text, once, after all the cards
+    yield modal_data_script(modals)
+
+def write_body(schedules, out):
+    """Write the page body to out, reusing the last run's when neither the schedules nor this script changed"""
+    key = hashlib.blake2b()
+    with open(__file__, 'rb') as f:
+        key.update(f.read())
+    key.update(json.dumps(schedules, sort_keys=True).encode('utf-8'))
+    digest = key.hexdigest().encode('ascii') + b'\n'
+
+    try:
+        with open(BODY_CACHE_FILE, 'rb') as f:
+            if f.readline() == digest:
+                shutil.copyfileobj(f, out)
+                return
+    except FileNotFoundError:
+        pass
+
+    # Stream each rink to the page and the cache as it is rendered, so the
+    # whole page never has to sit in memory at once
+    os.makedirs(os.path.dirname(BODY_CACHE_FILE), exist_ok=True)
+    with open(f"{BODY_CACHE_FILE}.tmp", 'wb') as cache:
+        cache.write(digest)
+        for section in render_sections(schedules):
+            chunk = section.encode('utf-8')
+            out.write(chunk)
+            cache.write(chunk)
+    os.replace(f"{BODY_CACHE_FILE}.tmp", BODY_CACHE_FILE)
+
+def generate_html(schedules, version, out):
+    """Write the HTML page for schedules, with cache busting, to the binary file out"""
+    # Only the header and footer carry the cache-busting version, so the body
+    # can be reused from a previous run with the same schedules
+    out.write((PAGE_HEADER % {'version': version}).encode('utf-8'))
+    write_body(schedules, out)
+    out.write((PAGE_FOOTER % {'version': version}).encode('utf-8'))
+
+def get_build_hash():
+    """Digest of the files the page is built from, and whether it's precompressed"""
+    key = hashlib.blake2b(str(PRECOMPRESS).encode(), digest_size=16)
+    for path in BUILD_INPUTS:
+        try:
+            with open(path, 'rb') as f:
+                key.update(f.read())
+        except FileNotFoundError:
+            pass
+        key.update(b'\0')
+    return key.hexdigest()
 
 def main():
     """Main entry point"""
     print("🚀 SIRS Website Generator")
     print("=" * 40)
 
+    # Skip the whole build (and keep the current cache version) when nothing
+    # it depends on has changed since the last one
+    build_hash = get_build_hash()
+    output_file = os.path.join("docs", "index.html")
+    try:
+        with open(BUILD_HASH_FILE) as f:
+            up_to_date = f.read().strip() == build_hash and os.path.exists(output_file)
+    except FileNotFoundError:
+        up_to_date = False
+    if up_to_date:
+        print(f"✅ Website up-to-date: {output_file}")
+        return
+
     # Get cache version
     print("🔢 Getting cache version...")
     version = get_cache_version()
@@ -167,20 +390,23 @@ def main():
     else:
         print(f"✅ Loaded {len(schedules)} schedules")
 
-    # Generate HTML
+    # Create docs directory for GitHub Pages
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # Generate HTML straight into the file, in large buffered writes
     print("🎨 Generating HTML...")
-    html_content = generate_html(schedules, version)
+    with open(output_file, 'wb', buffering=1 << 20) as f:
+        generate_html(schedules, version, f)
 
-    # Create docs directory for GitHub Pages
-    docs_dir = "docs"
-    if not os.path.exists(docs_dir):
-        os.makedirs(docs_dir)
-        print(f"📁 Created {docs_dir} directory")
-
-    # Write HTML file
-    output_file = os.path.join(docs_dir, "index.html")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    if PRECOMPRESS:
+        # mtime=0 keeps the .gz byte-identical when the page is
+        with open(output_file, 'rb') as f, \
+                gzip.GzipFile(f"{output_file}.gz", 'wb', compresslevel=9, mtime=0) as gz:
+            shutil.copyfileobj(f, gz)
+        print(f"🗜️  Precompressed: {output_file}.gz")
+
+    with open(BUILD_HASH_FILE, 'w') as f:
+        f.write(f"{build_hash}\n")
 
     print(f"✅ Website generated: {output_file}")
     print("🌐 Ready for GitHub Pages deployment!")